@@ -0,0 +1,136 @@
+'''
+Benchmarks the turn pipeline at every level configuration.
+
+Each level is set up on maps/game-map-natural.png with all of its enemies spawned at once,
+then a scripted sequence of spell casts is played for a number of turns.
+The time spent per turn in each system is written to a JSON file, so runs on different commits can be diffed.
+
+python benchmark.py --turns 20 --output benchmark.json
+'''
+import argparse
+import json
+import platform
+import random
+import subprocess
+
+import pygame
+from pygame import Surface
+
+from engine.ecs import EntityGroup
+from engine.profiler import FLUSH_KEY, Profiler
+from systems.levels import LEVELS, LevelComponent, apply_level_bounds, spawn_all_enemies
+from systems.tilemap import TilemapComponent
+
+import headless
+import systems
+
+BENCHMARK_SCRIPT = [
+    "cast wave",
+    "cast growth",
+    "cast fire",
+    "cast spark",
+    "cast ice",
+    "cast corrupt",
+    "cast purify",
+    "skip",
+]
+
+# The systems reported under each stage of the turn
+STAGES = {
+    "pathing": ["enemy_update_system"],
+    "effects": ["effect_update_system", "effect_grid_system"],
+    "collision": ["collision_update_system"],
+    "rendering": ["camera_update_system", "draw_sprite_system", "ui_update_system"],
+}
+
+PLAYER_HEALTH = 1_000_000 # Keeps the player alive for the whole run
+
+'''
+Builds a headless group with the rendering systems mounted onto an offscreen surface
+'''
+def create_benchmark_group(effect_grid: bool = False) -> EntityGroup:
+    group = headless.create_headless_group(BENCHMARK_SCRIPT, effect_grid)
+    surface = Surface(headless.SURFACE_SIZE)
+    systems.sprites.mount_sprite_system(group, surface)
+    systems.spell.mount_spell_system(group)
+    systems.ui.mount_ui_system(group)
+    return group
+
+'''
+Sets up the level with every enemy spawned, then plays the script for the given number of turns
+'''
+def run_level(level_number: int, turns: int, seed: int, effect_grid: bool = False) -> dict:
+    random.seed(seed)
+    group = create_benchmark_group(effect_grid)
+
+    # Run the start screen frame so the singletons exist, then set up the level
+    group.run_systems()
+    level: LevelComponent = group.query_singleton('level').level
+    map: TilemapComponent = group.query_singleton('tilemap').tilemap
+    level_config = LEVELS[level_number]
+    level.current_level = level_number
+    apply_level_bounds(map, level_config)
+    spawn_all_enemies(group, map, level_config)
+    group.query_singleton('player', 'health').health.health = PLAYER_HEALTH
+
+    group.profiler = Profiler(history=turns * 4)
+    summary = headless.run_headless(group, turns)
+    profile = group.profiler
+
+    played = max(summary["turns"], 1)
+    systems_ms = {
+        name: p.total_time * 1000 / played
+        for name, p in profile.systems.items()
+    }
+    return {
+        "level": level_number,
+        "turns": summary["turns"],
+        "frames": profile.frames,
+        "enemies": sum(level_config['enemies'].values()),
+        "seconds": summary["seconds"],
+        "ms_per_turn": sum(systems_ms.values()),
+        "stages_ms_per_turn": {
+            stage: sum(systems_ms.get(name, 0.0) for name in names)
+            for stage, names in STAGES.items()
+        },
+        "systems_ms_per_turn": systems_ms,
+        "flush_ms_per_turn": systems_ms.get(FLUSH_KEY, 0.0),
+    }
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the turn pipeline at every level")
+    parser.add_argument("--turns", type=int, default=20, help="Turns to play per level")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random number generator")
+    parser.add_argument("--levels", type=int, nargs="*", default=list(LEVELS), help="Levels to run")
+    parser.add_argument("--output", default="benchmark.json", help="Path of the JSON results file")
+    parser.add_argument("--effect-grid", action="store_true", help="Store effects as records indexed by cell, rather than as entities")
+    args = parser.parse_args()
+
+    pygame.font.init()
+
+    results = []
+    for level_number in args.levels:
+        result = run_level(level_number, args.turns, args.seed, args.effect_grid)
+        stages = ", ".join(f"{stage} {ms:.2f}" for stage, ms in result["stages_ms_per_turn"].items())
+        print(f"Level {level_number}: {result['ms_per_turn']:.2f} ms/turn ({stages})")
+        results.append(result)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "seed": args.seed,
+            "effect_grid": args.effect_grid,
+            "turns": args.turns,
+            "levels": results,
+        }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
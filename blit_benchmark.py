@@ -0,0 +1,53 @@
+'''
+Benchmarks blitting the tile sprites as loaded from disk, against the same sprites converted to the display format.
+
+A grid of tiles is blitted onto a display-format surface, as when the tilemap layer is rebuilt.
+The default 128x128 grid is the largest map bounds, so each frame is 16k blits.
+
+python blit_benchmark.py --grid 128 --tile-size 10 --frames 20
+'''
+import argparse
+import time
+
+import pygame
+
+from engine.assets import AssetPipeline
+from systems.tilemap import TILE_SPRITE_FILES
+
+'''
+Blits the sprites over a square grid, cycling through them, and returns the seconds per frame
+'''
+def time_grid(target: pygame.Surface, sprites: list[pygame.Surface], grid: int, tile_size: int, frames: int) -> float:
+    start = time.perf_counter()
+    for _ in range(frames):
+        for y in range(grid):
+            for x in range(grid):
+                target.blit(sprites[(x + y) % len(sprites)], (x * tile_size, y * tile_size))
+    return (time.perf_counter() - start) / frames
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blitting tile sprites before and after display-format conversion")
+    parser.add_argument("--grid", type=int, default=128, help="Width and height of the grid of tiles")
+    parser.add_argument("--tile-size", type=int, default=10, help="Size of a tile on screen, in pixels")
+    parser.add_argument("--frames", type=int, default=20, help="Frames to time for each format")
+    args = parser.parse_args()
+
+    pygame.display.init()
+    pygame.display.set_mode((1600, 1200))
+    asset_pipeline = AssetPipeline.get_instance()
+
+    size = (args.tile_size, args.tile_size)
+    raw = [ pygame.transform.scale(pygame.image.load(asset_pipeline.get_path(path)), size) for path in TILE_SPRITE_FILES.values() ]
+    converted = [ asset_pipeline.get_scaled(asset_pipeline.get_image(path), size) for path in TILE_SPRITE_FILES.values() ]
+    target = pygame.Surface((args.grid * args.tile_size, args.grid * args.tile_size))
+
+    raw_ms = time_grid(target, raw, args.grid, args.tile_size, args.frames) * 1000
+    converted_ms = time_grid(target, converted, args.grid, args.tile_size, args.frames) * 1000
+    print(f"{args.grid * args.grid} blits of {args.tile_size}px tiles per frame")
+    print(f"As loaded: {raw_ms:.2f} ms/frame")
+    print(f"Converted: {converted_ms:.2f} ms/frame ({raw_ms / converted_ms:.1f}x)")
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,3 @@
+python compile_maps.py
 pyinstaller main.py
 robocopy assets dist/main/assets /s
\ No newline at end of file
@@ -0,0 +1,24 @@
+'''
+Compiles every map image into its cached binary tilemap (see systems/tilemap.py),
+so the game does not need to parse the images when it starts.
+
+python compile_maps.py
+'''
+import glob
+import os.path
+
+from engine.assets import AssetPipeline
+from systems.tilemap import parse_tile_image, save_compiled_tile_map, tile_map_cache_path
+
+MAPS_DIR = 'maps'
+
+def main():
+    asset_pipeline = AssetPipeline.get_instance()
+    for source_path in sorted(glob.glob(os.path.join(asset_pipeline.get_path(MAPS_DIR), '*.png'))):
+        key = os.path.join(MAPS_DIR, os.path.basename(source_path))
+        map = parse_tile_image(key)
+        save_compiled_tile_map(source_path, map)
+        print(f"{key}: {map.shape[1]}x{map.shape[0]} -> {tile_map_cache_path(source_path)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,212 @@
+import collections
+import concurrent.futures
+import hashlib
+import json
 import os.path
+from typing import Callable
 
 import pygame
 
 ROOT_DIR = os.getcwd()
 
+SCALED_CACHE_SIZE = 512 # Number of scaled surfaces to keep before evicting the least recently used
+MANIFEST_KEY = "manifest.json"
+PRELOAD_WORKERS = 4
+
+'''
+A handle on assets being decoded in the background, as returned by AssetPipeline.preload.
+Poll done() or progress() each frame, then wait() to finish the load on the main thread.
+'''
+class AssetLoad():
+    def __init__(self, pipeline: 'AssetPipeline', images: list[str], sounds: list[str], futures: list[concurrent.futures.Future]):
+        self.pipeline = pipeline
+        self.images = images
+        self.sounds = sounds
+        self.futures = futures
+
+    '''
+    The fraction of the assets loaded so far, from 0 to 1
+    '''
+    def progress(self) -> float:
+        if not self.futures:
+            return 1.0
+        return sum(1 for f in self.futures if f.done()) / len(self.futures)
+
+    def done(self) -> bool:
+        return all(f.done() for f in self.futures)
+
+    '''
+    Blocks until all the assets are decoded, then moves them into the pipeline's caches, converting the images
+    to the display format. This must be called on the main thread. Raises the error of the first asset that failed to load.
+    '''
+    def wait(self, timeout: float | None = None):
+        for f in self.futures:
+            f.result(timeout)
+        for key in self.images:
+            self.pipeline.get_image(key)
+        for key in self.sounds:
+            self.pipeline.get_sound(key)
+
+'''
+The sha256 of a file's contents
+'''
+def file_hash(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def display_format(surface: pygame.Surface) -> tuple:
+    return surface.get_bitsize(), surface.get_masks()
+
 class AssetPipeline:
     __base_url: str = os.path.join(ROOT_DIR, "assets")
+    __instance: 'AssetPipeline' = None
     asset_dict: dict[str, any] = dict()
+    sound_dict: dict[str, pygame.mixer.Sound] = dict()
+
+    def __init__(self):
+        # Assets being decoded by preload, keyed like the caches. They are moved into the caches on the main thread.
+        self.pending: dict[str, concurrent.futures.Future] = dict()
+        # Called after the cached images are re-converted, so anything holding on to them can drop them
+        self.display_listeners: list[Callable[[], None]] = []
+        # The pixel format of the display the cached images were converted to, or None before there is a display
+        self.display_format: tuple | None = None
+        # Scaled surfaces keyed by the id of the source surface and the target size.
+        # The source is kept alongside the scaled surface, so its id cannot be reused while cached.
+        self.scaled_cache: collections.OrderedDict[tuple[int, tuple[int, int]], tuple[pygame.Surface, pygame.Surface]] = collections.OrderedDict()
 
     @staticmethod
     def get_instance():
-        if not hasattr(AssetPipeline, "__instance"):
+        if AssetPipeline.__instance is None:
             AssetPipeline.__instance = AssetPipeline()
 
         return AssetPipeline.__instance
 
+    '''
+    Reads the manifest of assets to preload, a json file with a list of "images" and a list of "sounds"
+    '''
+    def load_manifest(self, key: str = MANIFEST_KEY) -> dict[str, list[str]]:
+        with open(self.__build_path(key)) as f:
+            return json.load(f)
+
+    '''
+    Starts decoding the assets in a manifest on a pool of threads, and returns a handle on their progress.
+    The workers only decode files. The caches are only filled on the main thread, by get_image, get_sound or AssetLoad.wait.
+    Sounds are skipped if the mixer has not been initialised.
+    '''
+    def preload(self, manifest: dict[str, list[str]], workers: int = PRELOAD_WORKERS) -> AssetLoad:
+        images = manifest.get("images", [])
+        sounds = manifest.get("sounds", []) if pygame.mixer.get_init() else []
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assets")
+        for keys, cache, decode in ((images, self.asset_dict, pygame.image.load), (sounds, self.sound_dict, pygame.mixer.Sound)):
+            for key in keys:
+                if key not in cache and key not in self.pending:
+                    self.pending[key] = executor.submit(decode, self.__existing_path(key))
+        executor.shutdown(wait=False)
+        futures = [ self.pending[key] for key in images + sounds if key in self.pending ]
+        return AssetLoad(self, images, sounds, futures)
+
+    '''
+    Decodes an asset, or takes it from preload if it is being decoded there
+    '''
+    def __decode(self, key: str, decode):
+        future = self.pending.pop(key, None)
+        if future is not None:
+            return future.result()
+        return decode(self.__existing_path(key))
+
+    '''
+    Returns the image converted to the display format, loading it on first use. This must be called on the main thread.
+    '''
     def get_image(self, key: str) -> pygame.Surface:
         if key in self.asset_dict:
             return self.asset_dict[key]
-        
-        path = self.__build_path(key)
-        
-
-        if not os.path.exists(path):
-            raise FileNotFoundError(f"File {path} not found")
 
-        image = pygame.image.load(path)
+        image = self.to_display_format(self.__decode(key, pygame.image.load))
         self.asset_dict[key] = image
 
         return image
+
+    '''
+    Converts the surface to the pixel format of the display, so blitting it does not convert every pixel.
+    Surfaces with per-pixel alpha keep it. Without a display the surface is returned unchanged.
+    '''
+    def to_display_format(self, surface: pygame.Surface) -> pygame.Surface:
+        display = pygame.display.get_surface()
+        if display is None:
+            return surface
+        self.display_format = display_format(display)
+        if surface.get_flags() & pygame.SRCALPHA:
+            return surface.convert_alpha()
+        return surface.convert()
+
+    '''
+    Re-converts the cached images if the pixel format of the display has changed, such as after a video mode change.
+    Scaled surfaces are dropped, so they are scaled again from the re-converted images, and the display listeners are called.
+    '''
+    def display_changed(self):
+        display = pygame.display.get_surface()
+        if display is None or display_format(display) == self.display_format:
+            return
+        for key, image in list(self.asset_dict.items()):
+            self.asset_dict[key] = self.to_display_format(image)
+        self.clear_scaled()
+        for listener in self.display_listeners:
+            listener()
+
+    '''
+    Returns the decoded sound, loading it on first use. The mixer must be initialised.
+    '''
+    def get_sound(self, key: str) -> pygame.mixer.Sound:
+        if key in self.sound_dict:
+            return self.sound_dict[key]
+
+        sound = self.__decode(key, pygame.mixer.Sound)
+        self.sound_dict[key] = sound
+
+        return sound
+
+    '''
+    Returns the surface scaled to the given size. Results are cached, with the least recently used evicted.
+    '''
+    def get_scaled(self, surface: pygame.Surface, size: tuple[int, int]) -> pygame.Surface:
+        key = (id(surface), size)
+        cached = self.scaled_cache.get(key)
+        if cached is not None:
+            self.scaled_cache.move_to_end(key)
+            return cached[1]
+
+        # Sprites created before the display existed are converted here, as the scaled surface is what gets blitted
+        scaled = self.to_display_format(pygame.transform.scale(surface, size))
+        self.scaled_cache[key] = (surface, scaled)
+        if len(self.scaled_cache) > SCALED_CACHE_SIZE:
+            self.scaled_cache.popitem(last=False)
+        return scaled
+
+    '''
+    Returns the surface scaled by the given factor, as per pygame.transform.scale_by
+    '''
+    def get_scaled_by(self, surface: pygame.Surface, factor: float) -> pygame.Surface:
+        width, height = surface.get_size()
+        return self.get_scaled(surface, (int(width * factor), int(height * factor)))
+
+    '''
+    Drops all the scaled surfaces. This should be called when the render scale changes.
+    '''
+    def clear_scaled(self):
+        self.scaled_cache.clear()
     
+    '''
+    Returns the path on disk of an asset
+    '''
+    def get_path(self, key: str) -> str:
+        return self.__build_path(key)
+
     def __build_path(self, key: str):
         return os.path.join(self.__base_url, key)
-        
\ No newline at end of file
+
+    def __existing_path(self, key: str) -> str:
+        path = self.__build_path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"File {path} not found")
+        return path
+        
@@ -0,0 +1,177 @@
+'''
+Packs sprites into a single surface, an atlas, so they can be drawn with Surface.blits using an area of the atlas for each.
+Atlases are cached on disk, keyed by the hashes of the source images and the size each is packed at.
+'''
+import hashlib
+import json
+import math
+import os
+
+import pygame
+from pygame import Rect
+
+from engine.assets import AssetPipeline, file_hash
+
+ATLAS_DIRECTORIES = ('tiles', 'effects', 'creatures', 'player')
+ATLAS_CACHE_DIR = 'atlas'
+ATLAS_CACHE_VERSION = 1
+ATLAS_CACHE_LIMIT = 8 # The number of atlases kept on disk. The least recently used are deleted past this.
+
+source_hashes: dict[str, tuple[tuple[int, int], bytes]] = {} # The hash of each source image, with the size and mtime it was hashed at
+
+'''
+A packed surface, with the area of each sprite in it keyed by the sprite's asset key
+'''
+class Atlas():
+    def __init__(self, surface: pygame.Surface, rects: dict[str, Rect]):
+        self.surface = surface
+        self.rects = rects
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rects
+
+    def area(self, key: str) -> Rect:
+        return self.rects[key]
+
+'''
+The asset keys of every image in the given asset directories
+'''
+def atlas_keys(directories: tuple[str, ...] = ATLAS_DIRECTORIES) -> list[str]:
+    asset_pipeline = AssetPipeline.get_instance()
+    keys = []
+    for directory in directories:
+        names = sorted(os.listdir(asset_pipeline.get_path(directory)))
+        keys += [ f'{directory}/{name}' for name in names if name.endswith('.png') ]
+    return keys
+
+'''
+Packs rectangles of the given sizes onto shelves, tallest first, filling rows of a roughly square area.
+Returns the size of the packed area and the rect of each key.
+'''
+def pack_shelves(sizes: dict[str, tuple[int, int]]) -> tuple[tuple[int, int], dict[str, Rect]]:
+    area = sum(w * h for w, h in sizes.values())
+    width = max([ math.ceil(math.sqrt(area)) ] + [ w for w, _ in sizes.values() ])
+
+    rects = {}
+    x = y = shelf_height = 0
+    for key in sorted(sizes, key=lambda key: (-sizes[key][1], key)):
+        w, h = sizes[key]
+        if x + w > width:
+            x, y = 0, y + shelf_height
+            shelf_height = 0
+        rects[key] = Rect(x, y, w, h)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return (width, y + shelf_height), rects
+
+'''
+Scales each image to its size and copies it into a new atlas
+'''
+def pack_atlas(sizes: dict[str, tuple[int, int]]) -> Atlas:
+    asset_pipeline = AssetPipeline.get_instance()
+    size, rects = pack_shelves(sizes)
+    surface = pygame.Surface(size, pygame.SRCALPHA)
+    for key, rect in rects.items():
+        scaled = pygame.transform.scale(asset_pipeline.get_image(key), rect.size)
+        # The atlas starts fully transparent, so this copies the pixels (alpha included) without blending
+        surface.blit(scaled, rect, special_flags=pygame.BLEND_RGBA_MAX)
+    return Atlas(surface, rects)
+
+'''
+The hash of a source image, only read again if its size or modification time has changed
+'''
+def source_hash(path: str) -> bytes:
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    cached = source_hashes.get(path)
+    if cached is None or cached[0] != version:
+        cached = source_hashes[path] = (version, file_hash(path))
+    return cached[1]
+
+def atlas_digest(sizes: dict[str, tuple[int, int]]) -> str:
+    asset_pipeline = AssetPipeline.get_instance()
+    digest = hashlib.sha256(f'{ATLAS_CACHE_VERSION}'.encode())
+    for key in sorted(sizes):
+        digest.update(f'{key}:{sizes[key][0]}x{sizes[key][1]}'.encode())
+        digest.update(source_hash(asset_pipeline.get_path(key)))
+    return digest.hexdigest()
+
+def atlas_cache_path(digest: str) -> str:
+    return AssetPipeline.get_instance().get_path(os.path.join(ATLAS_CACHE_DIR, digest[:32]))
+
+'''
+Loads a cached atlas, if one exists for the digest. Returns None otherwise.
+'''
+def load_cached_atlas(digest: str) -> Atlas | None:
+    cache_path = atlas_cache_path(digest)
+    try:
+        with open(cache_path + '.json') as f:
+            index = json.load(f)
+        if index['digest'] != digest:
+            return None
+        surface = pygame.image.load(cache_path + '.png')
+        rects = { key: Rect(rect) for key, rect in index['rects'].items() }
+    except (OSError, pygame.error, ValueError, KeyError, TypeError):
+        return None
+    # Marks the entry as recently used, so it is pruned last
+    try:
+        os.utime(cache_path + '.json')
+    except OSError:
+        pass
+    return Atlas(surface, rects)
+
+'''
+Writes the atlas to the cache. Failures are ignored, as the cache is only an optimisation.
+'''
+def save_cached_atlas(digest: str, atlas: Atlas):
+    cache_path = atlas_cache_path(digest)
+    temp_paths = [ cache_path + '.png.tmp', cache_path + '.json.tmp' ]
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_paths[0], 'wb') as f:
+            pygame.image.save(atlas.surface, f, 'png')
+        with open(temp_paths[1], 'w') as f:
+            json.dump({ 'digest': digest, 'rects': { key: list(rect) for key, rect in atlas.rects.items() } }, f)
+        # The image is moved into place first, as the index is what marks the entry as complete
+        os.replace(temp_paths[0], cache_path + '.png')
+        os.replace(temp_paths[1], cache_path + '.json')
+    except (OSError, pygame.error):
+        for temp_path in temp_paths:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+    prune_atlas_cache()
+
+'''
+Deletes all but the ATLAS_CACHE_LIMIT most recently used atlases from the cache.
+Each window size can pack an atlas, so without this the cache would grow with every resize.
+'''
+def prune_atlas_cache(limit: int = ATLAS_CACHE_LIMIT):
+    cache_dir = AssetPipeline.get_instance().get_path(ATLAS_CACHE_DIR)
+    try:
+        indexes = [ entry for entry in os.scandir(cache_dir) if entry.name.endswith('.json') ]
+        indexes.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+    except OSError:
+        return
+    for entry in indexes[limit:]:
+        cache_path = entry.path.removesuffix('.json')
+        # The index is deleted first, so a partly deleted entry is never loaded
+        for path in (cache_path + '.json', cache_path + '.png'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+'''
+Returns an atlas of the images at the given sizes, from the disk cache if it has been packed before.
+The atlas surface is converted to the display format, if there is a display.
+'''
+def build_atlas(sizes: dict[str, tuple[int, int]]) -> Atlas:
+    digest = atlas_digest(sizes)
+    atlas = load_cached_atlas(digest)
+    if atlas is None:
+        atlas = pack_atlas(sizes)
+        save_cached_atlas(digest, atlas)
+    atlas.surface = AssetPipeline.get_instance().to_display_format(atlas.surface)
+    return atlas
@@ -1,8 +1,16 @@
 import typing
 import dataclasses
+import copy
+import time
+
+from pygame import Rect, Vector2
+
+from .profiler import Profiler, FLUSH_KEY
 
 COMPONENT_COUNT = 0
 COMPONENT_INDICES = {}
+COMPONENT_BITS: dict[str, int] = {}
+COMPONENT_MASKS: dict[tuple[str], int] = {} # Cache of compiled masks, keyed by component names
 
 '''
 Required to enable querying of a given component.
@@ -21,22 +29,24 @@ e.new_component = NewComponent()
 def enumerate_component(name: str):
     global COMPONENT_COUNT
     COMPONENT_INDICES[name] = COMPONENT_COUNT
+    COMPONENT_BITS[name] = 1 << COMPONENT_COUNT
     COMPONENT_COUNT += 1
+    COMPONENT_MASKS.clear() # Any previously compiled masks may have skipped this name
     def named_component_inner(component: typing.Callable):
         return dataclasses.dataclass(init=True, slots=True, kw_only=True)(component)
     return named_component_inner
 
 '''
-Creates a bitwise mask for all components in the entity
+Creates a bitwise mask for all components in the entity.
+Masks are compiled once for each tuple of names, and cached.
 '''
 def component_mask(components: tuple[str]):
-    mask = 0
-    for name in components:
-        try:
-            i = COMPONENT_INDICES[name]
-            mask |= 1 << i
-        except:
-            continue
+    mask = COMPONENT_MASKS.get(components)
+    if mask is None:
+        mask = 0
+        for name in components:
+            mask |= COMPONENT_BITS.get(name, 0)
+        COMPONENT_MASKS[components] = mask
     return mask
 
 '''
@@ -47,16 +57,58 @@ def factory(constructor: typing.Callable[[],typing.Any]) -> typing.Any:
     return dataclasses.field(default_factory=constructor)
 
 '''
-An entity is a collection of components
+Creates a run condition (see EntityGroup.mount_system) which is true when the key has changed since it was last checked.
+It is always true the first time.
+
+group.mount_system(system, run_if=changed(lambda group: group.query_singleton('player').motion.position.copy()))
+'''
+def changed(key: typing.Callable[['EntityGroup'], typing.Any]) -> 'RunCondition':
+    last = NOT_CHECKED = object()
+    def condition(group: 'EntityGroup') -> bool:
+        nonlocal last
+        value = key(group)
+        if last is not NOT_CHECKED and value == last:
+            return False
+        last = value
+        return True
+    return condition
+
+'''
+An entity is a collection of components.
+The component mask is kept up to date as components are attached or detached.
 '''
 class Entity():
     def __init__(self, name: str):
         self.name = name # Name for debugging
         self.mask = 0
+        self.id: int | None = None # Assigned when added to a group
+        self._group: 'EntityGroup | None' = None
+        self._archetype: 'Archetype | None' = None
+        self._row = 0 # Index within the archetype
 
     def __repr__(self) -> str:
         return f"<Entity: {self.name}>"
 
+    def __setattr__(self, key: str, value: typing.Any):
+        bit = COMPONENT_BITS.get(key)
+        if bit is not None and not self.mask & bit:
+            self._set_mask(self.mask | bit)
+        object.__setattr__(self, key, value)
+
+    def __delattr__(self, key: str):
+        object.__delattr__(self, key)
+        bit = COMPONENT_BITS.get(key)
+        if bit is not None:
+            self._set_mask(self.mask & ~bit)
+
+    '''
+    Updates the mask. If the entity is already in a group, it will be moved to its new archetype at the next flush.
+    '''
+    def _set_mask(self, mask: int):
+        object.__setattr__(self, 'mask', mask)
+        if self._group is not None:
+            self._group._changed_entity_queue.append(self)
+
     '''
     Returns true if this entity contains the specified keys
     '''
@@ -67,32 +119,166 @@ class Entity():
         return True
     
     '''
-    Clones an entity by cloning its components
+    Clones an entity by cloning its components.
+    If the same entity is cloned repeatedly, prefer a Prefab, which only builds its copy plan once.
     '''
     def clone(self) -> 'Entity':
-        e = Entity(self.name)
-        for key, value in vars(self).items():
-            if key not in ["name", "mask"]:
-                setattr(e, key, dataclasses.replace(value))
-        return e
-    
+        return Prefab(self).create()
     
+
+# Attributes of an entity that are not components
+ENTITY_ATTRIBUTES = ("name", "mask", "id", "_group", "_archetype", "_row")
+
+# Field values of these types are immutable, and can be shared between instances
+SHARED_TYPES = {int, float, bool, complex, str, bytes, tuple, frozenset, type(None)}
+
+# Field values of these types are copied per instance.
+# Any other types (such as sprite surfaces and fonts) are shared, as they would be by dataclasses.replace
+COPIED_TYPES: dict[type, typing.Callable[[typing.Any], typing.Any]] = {
+    Vector2: Vector2,
+    Rect: Rect,
+    list: list.copy,
+    dict: dict.copy,
+    set: set.copy,
+}
+
+'''
+Returns true if the value can be shared between instances
+'''
+def is_immutable(value: typing.Any) -> bool:
+    if type(value) is tuple:
+        return all(is_immutable(v) for v in value)
+    return type(value) in SHARED_TYPES
+
+'''
+Returns the function used to copy a field value, or None if the value can be shared.
+Containers are copied shallowly, unless they contain mutable values.
+'''
+def field_copier(value: typing.Any) -> typing.Callable[[typing.Any], typing.Any] | None:
+    value_type = type(value)
+    if value_type in (list, set, dict):
+        items = value.values() if value_type is dict else value
+        if not all(is_immutable(v) for v in items):
+            return copy.deepcopy
+    elif value_type is tuple and not is_immutable(value):
+        return copy.deepcopy
+    return COPIED_TYPES.get(value_type)
+
+'''
+A template entity, compiled into a plan for copying its components.
+The plan is built once, so creating instances only copies the fields that need copying.
+Field values are read from the template when instantiated.
+
+enemy = Prefab(create_enemy((0, 0)))
+e = enemy.create()
+wave = enemy.instantiate(100)
+'''
+class Prefab():
+    def __init__(self, template: Entity):
+        self.template = template
+        # (key, component class, shared fields, copied fields)
+        self.plan: list[tuple[str, type, list[str], list[tuple[str, typing.Callable]]]] = []
+        for key, component in vars(template).items():
+            if key in ENTITY_ATTRIBUTES:
+                continue
+            shared = []
+            copied = []
+            for field in dataclasses.fields(component):
+                copier = field_copier(getattr(component, field.name))
+                if copier is None:
+                    shared.append(field.name)
+                else:
+                    copied.append((field.name, copier))
+            self.plan.append((key, type(component), shared, copied))
+
+    '''
+    Creates a single instance of the template
+    '''
+    def create(self) -> Entity:
+        return self.instantiate(1)[0]
+
+    '''
+    Creates a batch of instances of the template.
+    The template is only read once, regardless of the batch size.
+    '''
+    def instantiate(self, n: int) -> list[Entity]:
+        template = self.template
+        attributes = {
+            "name": template.name,
+            "mask": template.mask,
+            "id": None,
+            "_group": None,
+            "_archetype": None,
+            "_row": 0,
+        }
+        components = []
+        for key, component_type, shared, copied in self.plan:
+            source = getattr(template, key)
+            components.append((
+                key,
+                component_type,
+                [ (name, getattr(source, name)) for name in shared ],
+                [ (name, copier, getattr(source, name)) for name, copier in copied ],
+            ))
+
+        entities = []
+        for _ in range(n):
+            e_attributes = attributes.copy()
+            for key, component_type, shared, copied in components:
+                component = component_type.__new__(component_type)
+                for name, value in shared:
+                    setattr(component, name, value)
+                for name, copier, value in copied:
+                    setattr(component, name, copier(value))
+                e_attributes[key] = component
+
+            e = Entity.__new__(Entity)
+            object.__setattr__(e, '__dict__', e_attributes)
+            entities.append(e)
+        return entities
+
+
 SystemFunction = typing.Callable[['EntityGroup'], None]
+RunCondition = typing.Callable[['EntityGroup'], bool]
+ObserverFunction = typing.Callable[[Entity], None]
+
+'''
+The table of entities sharing a component mask
+'''
+class Archetype(list):
+    __slots__ = ("mask",)
+
+    def __init__(self, mask: int):
+        super().__init__()
+        self.mask = mask
 
 class EntityGroup():
     def __init__(self):
-        self.entities: list[Entity] = []
-        self.systems: list[SystemFunction] = []
+        # Entities are stored in archetypes: one table per unique component mask.
+        # Queries only need to walk the tables that match, rather than every entity.
+        self.archetypes: dict[int, Archetype] = {}
+        self.systems: list[tuple[SystemFunction, RunCondition | None]] = []
+        # Callbacks for entities gaining or losing a set of components, as (mask, on_add, on_remove)
+        self._observers: list[tuple[int, ObserverFunction | None, ObserverFunction | None]] = []
         self._singleton_cache: dict[int, Entity] = {}
+        # Cached query results, as a list of the matching archetypes for each mask.
+        # New archetypes are appended to the matching views as they are created.
+        self._query_cache: dict[int, list[list[Entity]]] = {}
+        self._entity_ids: dict[int, Entity] = {}
+        self._next_id = 0
         self._add_entity_queue: list[Entity] = []
         self._remove_entity_queue: list[Entity] = []
+        self._changed_entity_queue: list[Entity] = []
+        self.profiler: Profiler | None = None # Assign a profiler to record system timing
 
     '''
-    Add a new entity to the group. The components must already be assigned, as they are used for component masks.
+    Add a new entity to the group. The mask is maintained by the entity as its components are assigned.
     This is deferred till the start of the next frame.
     '''
     def add(self, entity: Entity):
-        entity.mask = component_mask(vars(entity).keys())
+        if entity.id is None:
+            entity.id = self._next_id
+            self._next_id += 1
         self._add_entity_queue.append(entity)
 
     '''
@@ -110,28 +296,86 @@ class EntityGroup():
         self._remove_entity_queue.append(entity)
 
     '''
-    Adds a new system
+    Returns the entity with the given id, or None if it is not in the group.
+    Ids are stable for the lifetime of the entity, so can be held instead of the entity itself.
+    '''
+    def get(self, id: int) -> Entity | None:
+        return self._entity_ids.get(id)
+
+    '''
+    Adds a new system.
+    If a run condition is given, the system is only called on frames where the condition returns true.
     '''
-    def mount_system(self, system: SystemFunction):
-        self.systems.append(system)
+    def mount_system(self, system: SystemFunction, run_if: RunCondition | None = None):
+        self.systems.append((system, run_if))
+
+    '''
+    Registers callbacks for entities that contain the given components.
+    on_add is called when such an entity is added to the group, or gains the last of the components.
+    on_remove is called when it is removed from the group, or loses one of the components (which will already be detached).
+    Both are called while the entity queues are flushed, at the start of the frame.
+    Entities already in the group are passed to on_add straight away.
+    '''
+    def observe(self, *components: str, on_add: ObserverFunction | None = None, on_remove: ObserverFunction | None = None):
+        mask = component_mask(components)
+        self._observers.append((mask, on_add, on_remove))
+        if on_add is not None:
+            for e in self._query_mask(mask):
+                on_add(e)
 
     '''
     Run all the mounted systems (in the order they were mounted)
     '''
     def run_systems(self):
+        if self.profiler is not None:
+            self._run_systems_profiled()
+            return
+
         self._flush_entity_queues()
-        for system in self.systems:
-            system(self)
+        for system, run_if in self.systems:
+            if run_if is None or run_if(self):
+                system(self)
+
+    '''
+    Runs the systems as per run_systems, but records the timing of each with the profiler
+    '''
+    def _run_systems_profiled(self):
+        profiler = self.profiler
+        profiler.frames += 1
+        start = time.perf_counter()
+        self._flush_entity_queues()
+        profiler.record(FLUSH_KEY, time.perf_counter() - start)
+        for system, run_if in self.systems:
+            if run_if is None or run_if(self):
+                profiler.measure(system, self)
 
     '''
     Yields an iterable of entities which contain the required properties.
-    If this becomes too slow, we can just cache these.
+    Only the archetypes containing all the requested components are walked.
+    The matching archetypes are cached per mask, and kept up to date as new archetypes appear.
     '''
     def query(self, *components: str) -> typing.Generator[Entity, None, None]:
-        mask = component_mask(components)
-        for e in self.entities:
-            if e.mask & mask == mask:
-                yield e
+        return self._query_mask(component_mask(components))
+
+    def _query_mask(self, mask: int) -> typing.Generator[Entity, None, None]:
+        view = self._query_cache.get(mask)
+        if view is None:
+            view = self._query_cache[mask] = [
+                archetype for archetype_mask, archetype in self.archetypes.items()
+                if archetype_mask & mask == mask
+            ]
+        if self.profiler is not None:
+            self.profiler.entities += sum(len(archetype) for archetype in view)
+        for archetype in view:
+            yield from archetype
+
+    '''
+    Yields every entity in the group
+    '''
+    @property
+    def entities(self) -> typing.Generator[Entity, None, None]:
+        for archetype in self.archetypes.values():
+            yield from archetype
 
     '''
     Returns the first entity that contains the require properties.
@@ -141,26 +385,84 @@ class EntityGroup():
         mask = component_mask(components)
         if not mask in self._singleton_cache:
             try:
-                self._singleton_cache[mask] = next(self.query(*components))
+                self._singleton_cache[mask] = next(self._query_mask(mask))
             except StopIteration:
                 raise Exception(f"Singleton not found with [{', '.join(components)}]")
         return self._singleton_cache[mask]
     
     '''
-    Flushes the internal queues used for entity addition or removal
+    Flushes the internal queues used for entity addition or removal.
+    Entities which have had components attached or detached are also moved to their new archetype.
     '''
     def _flush_entity_queues(self):
 
         # Remove deleted entities
         if len(self._remove_entity_queue):
             for e in self._remove_entity_queue:
-                try:
-                    self.entities.remove(e)
-                except ValueError:
+                if e._group is not self:
                     continue # An entity could be removed twice. Ignore it.
+                self._notify(e, e._archetype.mask, 0)
+                self._detach_entity(e)
+                del self._entity_ids[e.id]
+                e._group = None
             self._remove_entity_queue.clear()
 
+        # Move entities with changed components
+        if len(self._changed_entity_queue):
+            for e in self._changed_entity_queue:
+                if e._group is not self or e._archetype is self.archetypes.get(e.mask):
+                    continue
+                old_mask = e._archetype.mask
+                self._detach_entity(e)
+                self._insert_entity(e)
+                self._notify(e, old_mask, e.mask)
+            self._changed_entity_queue.clear()
+
         # Add new entities
         if len(self._add_entity_queue):
-            self.entities.extend(self._add_entity_queue)
-            self._add_entity_queue.clear()
\ No newline at end of file
+            for e in self._add_entity_queue:
+                if e._group is None:
+                    e._group = self
+                    self._entity_ids[e.id] = e
+                    self._insert_entity(e)
+                    self._notify(e, 0, e.mask)
+            self._add_entity_queue.clear()
+
+    '''
+    Calls the observers of any component set the entity has entered or left, going from one mask to the other
+    '''
+    def _notify(self, e: Entity, old_mask: int, new_mask: int):
+        for mask, on_add, on_remove in self._observers:
+            was_matched = old_mask & mask == mask
+            is_matched = new_mask & mask == mask
+            if was_matched and not is_matched:
+                if on_remove is not None:
+                    on_remove(e)
+            elif is_matched and not was_matched:
+                if on_add is not None:
+                    on_add(e)
+
+    '''
+    Places an entity in the archetype for its mask, creating the archetype if required
+    '''
+    def _insert_entity(self, e: Entity):
+        archetype = self.archetypes.get(e.mask)
+        if archetype is None:
+            archetype = self.archetypes[e.mask] = Archetype(e.mask)
+            for mask, view in self._query_cache.items():
+                if e.mask & mask == mask:
+                    view.append(archetype)
+        e._row = len(archetype)
+        e._archetype = archetype
+        archetype.append(e)
+
+    '''
+    Removes an entity from its archetype in constant time, by swapping the last entity into its place
+    '''
+    def _detach_entity(self, e: Entity):
+        archetype = e._archetype
+        last = archetype.pop()
+        if last is not e:
+            archetype[e._row] = last
+            last._row = e._row
+        e._archetype = None
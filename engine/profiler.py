@@ -0,0 +1,131 @@
+import collections
+import csv
+import json
+import os.path
+import time
+
+# Upper edges of the histogram buckets, in milliseconds. The final bucket is unbounded.
+HISTOGRAM_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+FLUSH_KEY = "_flush_entity_queues"
+
+'''
+The CSV column name of each histogram bucket, named by its upper edge
+'''
+def histogram_columns() -> list[str]:
+    return [ f"le_{ms:g}ms" for ms in HISTOGRAM_BUCKETS_MS ] + [ f"gt_{HISTOGRAM_BUCKETS_MS[-1]:g}ms" ]
+
+'''
+Timing information for a single system (or the entity queue flush)
+'''
+class SystemProfile():
+    def __init__(self, name: str, history: int):
+        self.name = name
+        self.calls = 0
+        self.total_time = 0.0   # Seconds
+        self.max_time = 0.0     # Seconds
+        self.entities = 0       # Entities walked by queries, in total
+        self.samples: collections.deque[float] = collections.deque(maxlen=history)
+
+    def record(self, elapsed: float, entities: int):
+        self.calls += 1
+        self.total_time += elapsed
+        self.entities += entities
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        self.samples.append(elapsed)
+
+    '''
+    The mean time of the recent samples, in milliseconds
+    '''
+    def recent_ms(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(self.samples) * 1000 / len(self.samples)
+
+    '''
+    Counts the recent samples into the buckets given by HISTOGRAM_BUCKETS_MS
+    '''
+    def histogram(self) -> list[int]:
+        counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        for sample in self.samples:
+            ms = sample * 1000
+            i = 0
+            while i < len(HISTOGRAM_BUCKETS_MS) and ms > HISTOGRAM_BUCKETS_MS[i]:
+                i += 1
+            counts[i] += 1
+        return counts
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_ms": self.total_time * 1000,
+            "mean_ms": 0.0 if self.calls == 0 else self.total_time * 1000 / self.calls,
+            "recent_ms": self.recent_ms(),
+            "max_ms": self.max_time * 1000,
+            "entities": self.entities,
+            "mean_entities": 0.0 if self.calls == 0 else self.entities / self.calls,
+            "histogram": self.histogram(),
+        }
+
+
+'''
+Records the time spent in each system run by an EntityGroup.
+Assign one to EntityGroup.profiler to enable it.
+
+profiler = Profiler()
+group.profiler = profiler
+...
+profiler.export("profile.json")
+'''
+class Profiler():
+    def __init__(self, history: int = 120):
+        self.history = history # Number of samples kept for the rolling histogram
+        self.frames = 0
+        self.systems: dict[str, SystemProfile] = {}
+        self.entities = 0 # Entities walked by queries in the current measurement
+
+    def record(self, name: str, elapsed: float, entities: int = 0):
+        profile = self.systems.get(name)
+        if profile is None:
+            profile = self.systems[name] = SystemProfile(name, self.history)
+        profile.record(elapsed, entities)
+
+    '''
+    Times a single call, keyed by the function name
+    '''
+    def measure(self, function, *args):
+        self.entities = 0
+        start = time.perf_counter()
+        function(*args)
+        self.record(function.__name__, time.perf_counter() - start, self.entities)
+
+    '''
+    Returns the system profiles, slowest first (by recent mean time)
+    '''
+    def slowest(self) -> list[SystemProfile]:
+        return sorted(self.systems.values(), key=lambda p: -p.recent_ms())
+
+    def to_dict(self) -> dict:
+        return {
+            "frames": self.frames,
+            "histogram_buckets_ms": list(HISTOGRAM_BUCKETS_MS),
+            "systems": [ p.to_dict() for p in self.systems.values() ],
+        }
+
+    '''
+    Writes the profile to a file. The format is selected by the extension (.csv or .json).
+    The CSV has a column for each histogram bucket, after the totals.
+    '''
+    def export(self, path: str):
+        if os.path.splitext(path)[1].lower() == ".csv":
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["name", "calls", "total_ms", "mean_ms", "recent_ms", "max_ms", "entities", "mean_entities"] + histogram_columns())
+                for p in self.systems.values():
+                    d = p.to_dict()
+                    writer.writerow([d["name"], d["calls"], d["total_ms"], d["mean_ms"], d["recent_ms"], d["max_ms"], d["entities"], d["mean_entities"]] + d["histogram"])
+        else:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
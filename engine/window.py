@@ -1,5 +1,7 @@
 import pygame
 
+from engine.assets import AssetPipeline
+
 class Window():
 
     '''
@@ -21,6 +23,9 @@ class Window():
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.exited = True
+            elif event.type in (pygame.VIDEORESIZE, pygame.WINDOWDISPLAYCHANGED):
+                # The new display surface may have a different pixel format
+                AssetPipeline.get_instance().display_changed()
 
     '''
     Update the display (assuming the render surface has been modified).
@@ -0,0 +1,70 @@
+import time
+
+from pygame import Surface
+from pygame.time import Clock
+
+from init import init_tilemap
+from engine.ecs import EntityGroup
+from systems.levels import GameComponent, LevelComponent
+from systems.turn import TurnComponent
+
+import systems
+
+SURFACE_SIZE = (1600, 1200)
+
+'''
+Builds a group with only the simulation systems mounted.
+Input is driven by the script, and nothing is drawn or played.
+Effects are simulated by the effect grid system instead of the effect system if effect_grid is set.
+'''
+def create_headless_group(steps: list[str] = systems.script.DEFAULT_SCRIPT, effect_grid: bool = False) -> EntityGroup:
+    group = EntityGroup()
+
+    # Note, systems will be run in the order they are mounted
+    systems.time.mount_time_system(group, Clock())
+    systems.turn.mount_turn_system(group)
+    systems.levels.mount_level_system(group, Surface(SURFACE_SIZE))
+    systems.collision.mount_collision_system(group)
+    systems.script.mount_script_system(group, steps)
+    systems.enemy.mount_enemy_system(group)
+    if effect_grid:
+        systems.effect_grid.mount_effect_grid_system(group)
+    else:
+        systems.effect.mount_effect_system(group)
+    systems.motion.mount_motion_system(group)
+    systems.health.mount_health_system(group)
+    systems.sounds.mount_silent_sound_system(group)
+
+    group.add(systems.player.create_player())
+    init_tilemap(group)
+    return group
+
+'''
+Runs the simulation as fast as possible, until the given number of turns have been played or the game ends.
+Returns a summary of the run.
+'''
+def run_headless(group: EntityGroup, turns: int) -> dict:
+    start = time.perf_counter()
+    frames = 0
+
+    group.run_systems()
+    turn: TurnComponent = group.query_singleton('turn').turn
+    game: GameComponent = group.query_singleton('game').game
+    level: LevelComponent = group.query_singleton('level').level
+    clock: Clock = group.query_singleton('time').time.clock
+
+    while turn.number < turns and game.state in (GameComponent.STATE_START_SCREEN, GameComponent.STATE_PLAYING):
+        group.run_systems()
+        clock.tick() # No frame rate limit
+        frames += 1
+
+    player = group.query_singleton('player', 'health')
+    return {
+        "turns": turn.number,
+        "frames": frames,
+        "seconds": time.perf_counter() - start,
+        "level": level.current_level,
+        "player_health": player.health.health,
+        "enemies": len(list(group.query('enemy'))),
+        "game_over": game.state == GameComponent.STATE_GAME_OVER,
+    }
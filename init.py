@@ -5,13 +5,20 @@ from engine.window import Window
 from systems.tilemap import TilemapComponent, parse_tile_map
 
 
-def init(group: EntityGroup, _: Window):
-    map = parse_tile_map('maps/game-map-natural.png')
+MAP_PATH = 'maps/game-map-natural.png'
+
+
+def init_tilemap(group: EntityGroup, map_path: str = MAP_PATH):
+    map = parse_tile_map(map_path)
 
     tilemap = Entity("tilemap")
     tilemap.tilemap = TilemapComponent.from_map(map)
     group.add(tilemap)
 
+
+def init(group: EntityGroup, _: Window):
+    init_tilemap(group)
+
     pygame.mixer.music.load('assets/sounds/Retro_Forest_-_David_Fesliyan.mp3')
     pygame.mixer.music.set_volume(0.2)
     pygame.mixer.music.play(-1)
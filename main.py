@@ -1,28 +1,73 @@
+import argparse
+import random
+import sys
+
 import pygame
 from init import init
+from engine.assets import AssetPipeline
 from engine.window import Window
 from engine.ecs import EntityGroup
+from engine.profiler import Profiler
 
 import systems
 
+parser = argparse.ArgumentParser(description="Spellscale")
+parser.add_argument("--profile", nargs="?", const="profile.json", default=None, metavar="PATH",
+                    help="Record per-system timing, show it on screen, and write it to PATH (.json or .csv) on exit")
+parser.add_argument("--headless", action="store_true",
+                    help="Run only the simulation, without a display, as fast as possible")
+parser.add_argument("--turns", type=int, default=100, help="Number of turns to play when headless")
+parser.add_argument("--script", default=None, metavar="PATH", help="Script of player turns to play when headless")
+parser.add_argument("--seed", type=int, default=None, help="Seed for the random number generator")
+parser.add_argument("--effect-grid", action="store_true", help="Store effects as records indexed by cell, rather than as entities")
+args = parser.parse_args()
+
+if args.seed is not None:
+    random.seed(args.seed)
+
+if args.headless:
+    import headless
+    steps = systems.script.load_script(args.script) if args.script else systems.script.DEFAULT_SCRIPT
+    group = headless.create_headless_group(steps, args.effect_grid)
+    if args.profile:
+        group.profiler = Profiler()
+    summary = headless.run_headless(group, args.turns)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if group.profiler:
+        group.profiler.export(args.profile)
+    sys.exit(0)
+
 # Build objects
 window = Window((1600, 1200), "Spellscale")
 group = EntityGroup()
 
+# Decode the assets in the background while the start screen is shown
+asset_pipeline = AssetPipeline.get_instance()
+loading = asset_pipeline.preload(asset_pipeline.load_manifest())
+
+if args.profile:
+    group.profiler = Profiler()
+
 # Load systems onto the group
 # Note, systems will be run in the order they are mounted
 systems.time.mount_time_system(group, window.clock)
 systems.turn.mount_turn_system(group)
-systems.levels.mount_level_system(group, window.surface)
+systems.levels.mount_level_system(group, window.surface, loading)
 systems.collision.mount_collision_system(group)
 systems.controls.mount_control_system(group)
 systems.player.mount_player_system(group)
 systems.enemy.mount_enemy_system(group)
-systems.effect.mount_effect_system(group)
+if args.effect_grid:
+    systems.effect_grid.mount_effect_grid_system(group)
+else:
+    systems.effect.mount_effect_system(group)
 systems.motion.mount_motion_system(group)
 systems.health.mount_health_system(group)
 systems.sprites.mount_sprite_system(group, window.surface)
 systems.spell.mount_spell_system(group)
+if group.profiler:
+    systems.profiling.mount_profiler_system(group, group.profiler)
 systems.ui.mount_ui_system(group)
 systems.sounds.mount_sound_system(group)
 
@@ -35,4 +80,7 @@ while not window.exited:
     group.run_systems()
     window.update()
 
+if group.profiler:
+    group.profiler.export(args.profile)
+
 window.close()
@@ -7,10 +7,13 @@ from . import testing
 from . import time
 from . import turn
 from . import effect
+from . import effect_grid
 from . import spell
 from . import ui
 from . import health
 from . import enemy
 from . import collision
 from . import levels
-from . import sounds
\ No newline at end of file
+from . import sounds
+from . import profiling
+from . import script
\ No newline at end of file
@@ -1,61 +1,141 @@
 from engine.ecs import Entity, EntityGroup, enumerate_component, factory
 import typing
 
-from pygame import Vector2
+from pygame import Rect, Vector2
 
 from .motion import MotionComponent
 from . import motion
 
 
+type Cell = tuple[int, int]
+
+def cell_key(pos: Vector2 | tuple[int, int]) -> Cell:
+    return (int(pos[0]), int(pos[1]))
+
 '''
-A component that does collision detection
+A component that does collision detection.
+Each layer is a spatial hash, mapping a cell to the entities positioned in it.
+The index is kept up to date as entities are added, removed and moved, rather than rebuilt each frame.
+Changes are queued, and applied once a frame by the collision update system, where the index used to be rebuilt.
+
+Queued moves are counted by is_occupied straight away. The rebuilt index held the entities rather than their positions,
+so an entity that moved was found at its new cell for the rest of the frame, and the motion system relies on this
+to stop two entities moving into the same cell.
 '''
 @enumerate_component("collision")
 class CollisionComponent():
     lookup = {}
-    layers: list[list[Entity]] = factory(list)
+    layers: list[dict[Cell, list[Entity]]] = factory(list)
+    entries: dict[int, tuple[int, Cell]] = factory(dict) # The layer and cell of each indexed entity, by id
+    pending: list[tuple[typing.Callable[[Entity], None], Entity]] = factory(list) # Queued changes to the index, in order
+    moved: dict[tuple[int, Cell], int] = factory(dict) # The change in entities at each layer and cell, from queued moves
 
     def get_entities_at(self, pos: Vector2, layer: int) -> typing.Generator[Entity,None,None]:
-        for e in self.layers[layer]:
-            if e.motion.position == pos:
-                yield e
+        yield from self.layers[layer].get(cell_key(pos), ())
 
     def is_occupied(self, pos: Vector2, layer: int) -> bool:
-        for e in self.layers[layer]:
-            if e.motion.position == pos:
-                return True
-        return False
-        
+        key = cell_key(pos)
+        return len(self.layers[layer].get(key, ())) + self.moved.get((layer, key), 0) > 0
+
+    '''
+    Yields the entities on the layer positioned within the area
+    '''
+    def get_entities_in(self, area: Rect, layer: int) -> typing.Generator[Entity,None,None]:
+        cells = self.layers[layer]
+        if area.width * area.height <= len(cells):
+            for y in range(area.top, area.bottom):
+                for x in range(area.left, area.right):
+                    yield from cells.get((x, y), ())
+        else:
+            for (x, y), entities in list(cells.items()):
+                if area.left <= x < area.right and area.top <= y < area.bottom:
+                    yield from entities
+
+    '''
+    Indexes an entity at its current position. Entities without a layer are ignored.
+    '''
+    def add(self, e: Entity):
+        layer = e.motion.layer
+        if layer is None:
+            return
+        key = cell_key(e.motion.position)
+        self.layers[layer].setdefault(key, []).append(e)
+        self.entries[e.id] = (layer, key)
+
+    def remove(self, e: Entity):
+        entry = self.entries.pop(e.id, None)
+        if entry is None:
+            return
+        layer, key = entry
+        cells = self.layers[layer]
+        entities = cells[key]
+        entities.remove(e)
+        if not entities:
+            del cells[key]
+
+    '''
+    Moves an entity in the index to its current position
+    '''
+    def move(self, e: Entity):
+        entry = self.entries.get(e.id)
+        if entry is not None and entry == (e.motion.layer, cell_key(e.motion.position)):
+            return
+        self.remove(e)
+        self.add(e)
+
+    def queue_add(self, e: Entity):
+        self.pending.append((self.add, e))
+
+    def queue_remove(self, e: Entity):
+        self.pending.append((self.remove, e))
+
+    def queue_move(self, e: Entity):
+        entry = self.entries.get(e.id)
+        if entry is not None:
+            self.moved[entry] = self.moved.get(entry, 0) - 1
+        if e.motion.layer is not None:
+            key = (e.motion.layer, cell_key(e.motion.position))
+            self.moved[key] = self.moved.get(key, 0) + 1
+        self.pending.append((self.move, e))
+
+    '''
+    Applies the queued changes, in the order they were made
+    '''
+    def apply_pending(self):
+        pending, self.pending = self.pending, []
+        self.moved.clear()
+        for change, e in pending:
+            change(e)
+
+    def clear(self):
+        for layer in self.layers:
+            layer.clear()
+        self.entries.clear()
+        self.pending.clear()
+        self.moved.clear()
+
     @staticmethod
     def from_layer_count(layers: int) -> 'CollisionComponent':
-        return CollisionComponent(layers=[ [] for _ in range(layers) ])
-
+        return CollisionComponent(layers=[ dict() for _ in range(layers) ])
 
 
 '''
-The sprite drawings system:
-Use the camera position to draw all entities with a sprite at their relative location.
+The collision update system:
+Brings the index up to date with the entities added, removed and moved since it last ran
 '''
-def collision_system(group: EntityGroup):
-
-    collisions: CollisionComponent = group.query_singleton("collision").collision
-
-    for layer in collisions.layers:
-        layer.clear()
-
-    for e in group.query("motion"):
-        motion: MotionComponent = e.motion
-        if motion.layer != None:
-            collisions.layers[motion.layer].append(e)
+def collision_update_system(group: EntityGroup):
+    collision: CollisionComponent = group.query_singleton("collision").collision
+    collision.apply_pending()
 
 
 '''
-Mounts the sprite drawing system, and adds a camera component for the viewport
+Mounts the collision index, which follows entities with a motion component as they are added and removed.
+Movement is queued by the motion system.
 '''
 def mount_collision_system(group: EntityGroup):
     e = Entity("collision")
     e.collision = CollisionComponent.from_layer_count(motion.LAYER_COUNT)
     group.add(e)
 
-    group.mount_system(collision_system)
-
+    group.observe("motion", on_add=e.collision.queue_add, on_remove=e.collision.queue_remove)
+    group.mount_system(collision_update_system)
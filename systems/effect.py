@@ -1,6 +1,8 @@
-from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from engine.ecs import Entity, EntityGroup, Prefab, enumerate_component, factory
 from pygame import Vector2
 from dataclasses import dataclass
+from typing import Any, Callable, Iterable
+import functools
 import random
 import math
 
@@ -9,11 +11,10 @@ from systems.sounds import SoundComponent
 from .sprites import SpriteComponent
 from .motion import MotionComponent
 from .tilemap import TilemapComponent
-from .collision import CollisionComponent
+from .collision import Cell, CollisionComponent
 from .health import HealthComponent
 from . import turn
 from . import tilemap
-from . import utils
 from . import motion
 
 
@@ -54,10 +55,12 @@ class EffectComponent():
         return self.shape != SHAPE_NONE
 
 
+CARDINALS = ((1, 0), (0, 1), (-1, 0), (0, -1)) # In the order of utils.vector_cardinals
+
 '''
 Enumerates through the valid targets for a given effect
 '''
-def valid_tiles(map: TilemapComponent, valid: list[int], coords: list[Vector2]):
+def valid_tiles(map: TilemapComponent, valid: list[int] | dict, coords: list[Cell]):
     return [ coord for coord in coords if (map.get_tile(coord) in valid) ]
 
 '''
@@ -70,15 +73,19 @@ def shuffled(items: list) -> list:
     return items
 
 
-def try_harvest(map: TilemapComponent, pos: Vector2, effect: EffectComponent):
+'''
+Converts the tile at the position, if the effect harvests it. Returns the energy gained.
+'''
+def harvest_tile(map: TilemapComponent, pos: Cell, effect: EffectComponent) -> int:
     tile = map.get_tile(pos)
     if tile in effect.harvests:
         new_tile, energy_gain = effect.harvests[tile]
         map.set_tile(pos, new_tile)
-        effect.energy += energy_gain
+        return energy_gain
+    return 0
 
 
-def apply_damage(collision: CollisionComponent, pos: Vector2, damage: int):
+def apply_damage(collision: CollisionComponent, pos: Cell, damage: int):
     for e in collision.get_entities_at(pos, motion.LAYER_PLAYER):
         health: HealthComponent = e.health
         health.health -= damage
@@ -87,6 +94,94 @@ def apply_damage(collision: CollisionComponent, pos: Vector2, damage: int):
         health: HealthComponent = e.health
         health.health -= damage
 
+'''
+Advances a single effect by a turn: it harvests its tile, damages what is on it, propagates, then decays.
+Returns the energy left, and the effect is removed once that is 0 or less.
+
+This is shared by the effect system and the effect grid, which only differ in how the effects are stored:
+- occupants(coord) gives the name of each effect at a position, with the effect to pass to consume
+- consume(other) removes an effect this one consumes
+- spawn(coord, energy, shape) adds an effect propagated to a position, with this effect's type and direction
+'''
+def step_effect(
+        map: TilemapComponent, collision: CollisionComponent, effect: EffectComponent,
+        pos: Cell, dir: Cell, shape: int, energy: float,
+        occupants: Callable[[Cell], Iterable[tuple[str, Any]]], consume: Callable[[Any], None], spawn: Callable[[Cell, float, int], None]) -> float:
+    x, y = pos
+    dx, dy = dir
+
+    # Harvesting
+    energy += harvest_tile(map, pos, effect)
+
+    # Propagation
+    if energy > 1:
+
+        apply_damage(collision, pos, effect.damage)
+
+        # A list of places we would like to try propagate to.
+        # (position, energy, shape)
+        propagation_request: list[tuple[Cell, float, int]] = []
+        unchecked_coords: list[Cell] = []
+        normals = [ (x + dy, y - dx), (x - dy, y + dx) ] # Clockwise then counter clockwise, as utils.vector_normals
+
+        # Do the forced propagation, which is shape specific
+        if shape == SHAPE_WAVE:
+            # Waves transfer all energy forward.
+            propagation_request = [
+                ((x + dx, y + dy), energy - 1, SHAPE_WAVE),
+            ]
+
+            # Waves start waves in valid adjacent tiles
+            for coord in valid_tiles(map, effect.propagates_to, normals):
+                propagation_request.append( (coord, 0, SHAPE_WAVE) )
+            unchecked_coords = [(x - dx, y - dy)]
+
+        elif shape == SHAPE_FILL:
+            # Goes out in all directions
+            valid_coords = valid_tiles(map, effect.propagates_to, shuffled((x + cx, y + cy) for cx, cy in CARDINALS))
+            # Let the propagation step figure out if we use more energy than we have...
+            if len(valid_coords):
+                energy_transfer =  math.ceil(energy) / len(valid_coords)
+                for coord in valid_coords:
+                    propagation_request.append( (coord, energy_transfer, SHAPE_FILL) )
+
+        elif shape == SHAPE_LANCE:
+            # Goes forward only
+            propagation_request = [
+                ((x + dx, y + dy), energy - 1, SHAPE_LANCE),
+            ]
+            # The reverse direction is checked as is, rather than the tile behind the lance
+            unchecked_coords = normals + [(-dx, -dy)]
+
+        else: # SHAPE_NONE
+            unchecked_coords = [ (x + cx, y + cy) for cx, cy in CARDINALS ]
+
+        # Do the random propagation in the unchecked directions
+        for coord in shuffled( valid_tiles(map, effect.chains_to, unchecked_coords) ):
+            probability, chain_energy = effect.chains_to[map.get_tile(coord)]
+            if random.random() < probability:
+                propagation_request.append( (coord, chain_energy, SHAPE_NONE) )
+
+        # Apply the propagation requests
+        for coord, request_energy, request_shape in propagation_request:
+
+            blocked = False
+            for name, other in occupants(coord):
+                if name in effect.consumes:
+                    consume(other)
+                else:
+                    blocked = True
+
+            if not blocked:
+                request_energy = min(request_energy, max(0, energy - 1))
+                energy -= request_energy
+                request_energy += harvest_tile(map, coord, effect)
+                apply_damage(collision, coord, effect.damage)
+                spawn(coord, request_energy, request_shape)
+
+    # decay
+    return energy - 1
+
 '''
 The effect update system:
 Handles effect propigation and decay (probably)
@@ -101,110 +196,43 @@ def effect_update_system(group: EntityGroup):
     map: TilemapComponent = group.query_singleton('tilemap').tilemap
     collision: CollisionComponent = group.query_singleton('collision').collision
 
+    def consume(other: Entity):
+        other.effect.energy = 0
+        group.remove(other)
+
     for e in group.query("effect", "motion"):
-        
         effect: EffectComponent = e.effect
-        motion: MotionComponent = e.motion
-        pos = motion.position
-        dir = effect.direction
-
-        # Harvesting
-        try_harvest(map, pos, effect)
-        
-        # Propagation
-        if effect.energy > 1:
-
-            apply_damage(collision, pos, effect.damage)
-
-            # A list of places we would like to try propagate to.
-            # (position, energy, shape)
-            propagation_request: list[tuple[Vector2, int, int]] = []
-            unchecked_coords = []
-
-            # Do the forced propagation, which is shape specific
-            if effect.shape == SHAPE_WAVE:
-                # Waves transfer all energy forward.
-                propagation_request = [
-                    (pos + dir, effect.energy - 1, SHAPE_WAVE),
-                ]
-
-                # Waves start waves in valid adjacent tiles
-                for coord in valid_tiles(map, effect.propagates_to, utils.vector_normals(pos, dir)):
-                    propagation_request.append( (coord, 0, SHAPE_WAVE) )
-                unchecked_coords = [pos-dir]
-
-            elif effect.shape == SHAPE_FILL:
-                # Goes out in all directions
-                valid_coords = valid_tiles(map, effect.propagates_to, shuffled(utils.vector_cardinals(pos)))
-                # Let the propagation step figure out if we use more energy than we have...
-                if len(valid_coords):
-                    energy_transfer =  math.ceil(effect.energy) / len(valid_coords)
-                    for coord in valid_coords:
-                        propagation_request.append( (coord, energy_transfer, SHAPE_FILL) )
-
-            elif effect.shape == SHAPE_LANCE:
-                # Goes forward only
-                propagation_request = [
-                    (pos + dir, effect.energy - 1, SHAPE_LANCE),
-                ]
-                unchecked_coords = list(utils.vector_normals(pos, dir)) + [-dir]
-
-            else: # SHAPE_NONE
-                unchecked_coords = utils.vector_cardinals(pos)
-
-            # Do the random propagation in the unchecked directions
-            for coord in shuffled( valid_tiles(map, effect.chains_to, unchecked_coords) ):
-                probability, energy = effect.chains_to[map.get_tile(coord)]
-                if random.random() < probability:
-                    propagation_request.append( (coord, energy, SHAPE_NONE) )
-            
-            # Apply the propagation requests
-            for coord, energy, shape in propagation_request:
-                
-                blocked = False
-                for other in collision.get_entities_at(coord, e.motion.layer):
-                    if other.effect.name in effect.consumes:
-                        other.effect.energy = 0
-                        group.remove(other)
-                    else:
-                        blocked = True
-
-                if not blocked:
-                    energy = min(energy, max(0, effect.energy -1))
-                    new_entity = propagate_entity(e, coord, energy, shape)
-                    try_harvest(map, coord, new_entity.effect)
-                    apply_damage(collision, coord, effect.damage)
-                    group.add(new_entity)
-
-        # decay
-        effect.energy -= 1
+        layer = e.motion.layer
+
+        def occupants(coord: Cell):
+            return ((other.effect.name, other) for other in collision.get_entities_at(coord, layer))
+
+        def spawn(coord: Cell, energy: float, shape: int):
+            group.add(propagate_entity(e, Vector2(coord), energy, shape))
+
+        effect.energy = step_effect(map, collision, effect, tuple(e.motion.position), tuple(effect.direction), effect.shape, effect.energy, occupants, consume, spawn)
         if effect.energy <= 0:
             group.remove(e)
 
 
 '''
-Propagates an existing effect, inheriting some energy. Shape may be overridden here.
+Propagates an existing effect to a new position, with the given energy. Shape may be overridden here.
+The new effect is instantiated from the template, and inherits the direction and shape of the existing one.
 '''
 def propagate_entity(e: Entity, position: Vector2, energy: int, shape: int | None = None) -> Entity:
-    # Remove the energy from the previous effect
-    e.effect.energy -= energy
-
-    # Create the new effect
-    e = e.clone()
-    e.motion.position = position
-    e.effect.energy = energy
-    if e.contains('sound'):
-        e.sound.state = SoundComponent.STATE_PLAY
-
-    # The shape may be overridden
-    if shape != None:
-        e.effect.shape = shape
+    new = effect_prefabs()[e.effect.name].create()
+    new.motion.position = position
+    new.effect.energy = energy
+    new.effect.direction = e.effect.direction
+    new.effect.shape = e.effect.shape if shape == None else shape
+    if new.contains('sound'):
+        new.sound.state = SoundComponent.STATE_PLAY
 
-    return e
+    return new
 
 
 '''
-Instantiate all the template effects. These can be cloned when required
+Instantiate all the template effects. These are compiled into prefabs for instantiation.
 '''
 def create_effect_templates():
     effect_dict = {}
@@ -220,7 +248,7 @@ def create_effect_templates():
     e.effect.add_harvest(tilemap.TILE_ROCK, tilemap.TILE_LAVA, -5)
     e.effect.add_chain(tilemap.TILE_PLANT, 0.5)
     e.effect.add_consumes("growth")
-    e.sound = SoundComponent(sound_file='assets/sounds/fire.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/fire.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-wave")
@@ -230,7 +258,7 @@ def create_effect_templates():
     e.effect.add_harvest(tilemap.TILE_WATER, tilemap.TILE_MUD, 3, True)
     e.effect.add_harvest(tilemap.TILE_EARTH, tilemap.TILE_MUD, 0)
     e.effect.add_harvest(tilemap.TILE_EMBER, tilemap.TILE_ROCK, -1)
-    e.sound = SoundComponent(sound_file='assets/sounds/splash.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/splash.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-growth")
@@ -243,7 +271,7 @@ def create_effect_templates():
     e.effect.add_chain(tilemap.TILE_MUD, 0.25)
     e.effect.add_chain(tilemap.TILE_EARTH, 0.25)
     e.effect.add_chain(tilemap.TILE_ASH, 0.25)
-    e.sound = SoundComponent(sound_file='assets/sounds/grow.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/grow.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-spark")
@@ -254,7 +282,7 @@ def create_effect_templates():
     e.effect.add_harvest(tilemap.TILE_MARSH, tilemap.TILE_OOZE, 2, True)
     e.effect.add_chain(tilemap.TILE_EMBER, 0.25)
     e.effect.add_chain(tilemap.TILE_MARSH, 0.25)
-    e.sound = SoundComponent(sound_file='assets/sounds/zap.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/zap.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-ice")
@@ -263,7 +291,7 @@ def create_effect_templates():
     e.effect = EffectComponent(name="ice", cast_from=[tilemap.TILE_WATER], shape=SHAPE_LANCE, damage=25)
     e.effect.add_harvest(tilemap.TILE_WATER, tilemap.TILE_ICE, 2, True)
     e.effect.add_harvest(tilemap.TILE_HELLSCAPE, tilemap.TILE_ASH, 1, True)
-    e.sound = SoundComponent(sound_file='assets/sounds/ice.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/ice.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-corrupt")
@@ -275,7 +303,7 @@ def create_effect_templates():
     e.effect.add_harvest(tilemap.TILE_EMBER, tilemap.TILE_ASH, 2, True)
     e.effect.add_harvest(tilemap.TILE_LAVA, tilemap.TILE_HELLSCAPE, 2, True)
     e.effect.add_harvest(tilemap.TILE_BONES, tilemap.TILE_EARTH, 4, True)
-    e.sound = SoundComponent(sound_file='assets/sounds/curse.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/curse.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
 
     e = Entity("effect-purify")
@@ -287,19 +315,28 @@ def create_effect_templates():
     e.effect.add_harvest(tilemap.TILE_ASH, tilemap.TILE_EMBER, 2, True)
     e.effect.add_harvest(tilemap.TILE_HELLSCAPE, tilemap.TILE_LAVA, 2, True)
     e.effect.add_harvest(tilemap.TILE_BONES, tilemap.TILE_EARTH, 4, True)
-    e.sound = SoundComponent(sound_file='assets/sounds/purify.mp3', volume=0.5, state=0)
+    e.sound = SoundComponent(sound_file='sounds/purify.mp3', volume=0.5, state=0)
     effect_dict[e.effect.name] = e
     
     return effect_dict
 
-EFFECT_TEMPLATES = create_effect_templates()
+'''
+The effect templates and their prefabs, created on first use rather than at import, after the preloader has decoded their sprites
+'''
+@functools.cache
+def effect_templates() -> dict[str, Entity]:
+    return create_effect_templates()
+
+@functools.cache
+def effect_prefabs() -> dict[str, Prefab]:
+    return { name: Prefab(template) for name, template in effect_templates().items() }
 
 
 '''
 Spawns a new effect (as per a spell)
 '''
 def create_effect(type: str, position: Vector2, direction: Vector2 = Vector2(0)) -> Entity:
-    e = EFFECT_TEMPLATES[type].clone()
+    e = effect_prefabs()[type].create()
     e.motion.position = Vector2(position)
     e.effect.direction = direction
     return e
@@ -309,4 +346,4 @@ def create_effect(type: str, position: Vector2, direction: Vector2 = Vector2(0))
 Mounts the effect updating system
 '''
 def mount_effect_system(group: EntityGroup):
-    group.mount_system(effect_update_system)
+    group.mount_system(effect_update_system, run_if=turn.in_state(turn.TURN_EFFECTS))
@@ -0,0 +1,198 @@
+import itertools
+
+import numpy
+from pygame import Surface, Vector2
+
+from engine.assets import AssetPipeline
+from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from systems.sounds import SoundComponent
+
+from .collision import Cell, CollisionComponent
+from .effect import EffectComponent, effect_templates, step_effect
+from .motion import MotionComponent
+from .sprites import TILE_SCALE, screen_positions
+from .tilemap import TilemapComponent
+from . import turn
+
+'''
+An alternative store for the effect system, which keeps every effect as a plain record indexed by cell
+rather than as one entity per tile.
+
+Effects are advanced by effect.step_effect, as the effect system's are, so under the same seed they play out the same:
+- Effects are stepped in the order the effect system would query them in.
+  Spread effects are appended, and removed effects are swapped out for the last one, as an archetype does.
+- Effects spread and removed during the turn are only stored at the end of it,
+  as the entity queues and the collision index only update at the start of the next frame.
+
+What it saves is the entity per tile: there are no prefab instances, queued adds and removes,
+observer notifications or collision index updates for effects, and cells are integer tuples rather than Vector2s.
+
+The one difference is sound: each effect type plays its sound once per turn, at the first tile it spread to,
+where the effect system plays the sound of every spread effect.
+
+Spells still cast effect entities. These are absorbed into the store at the start of the effect turn.
+'''
+
+'''
+The effect templates, indexed by effect type
+'''
+class EffectRules():
+    def __init__(self, templates: dict[str, Entity]):
+        self.names = list(templates)
+        self.index = { name: i for i, name in enumerate(self.names) }
+        self.effects: list[EffectComponent] = [ template.effect for template in templates.values() ]
+        self.sprites: list[Surface] = [ template.sprite.surface for template in templates.values() ]
+        self.sounds: list[SoundComponent | None] = [ template.sound if template.contains('sound') else None for template in templates.values() ]
+
+'''
+An effect on a tile, holding what an effect entity would
+'''
+class GridEffect():
+    __slots__ = ('type', 'cell', 'energy', 'direction', 'shape', 'row')
+
+    def __init__(self, type: int, cell: Cell, energy: float, direction: Cell, shape: int):
+        self.type = type
+        self.cell = cell
+        self.energy = energy
+        self.direction = direction
+        self.shape = shape
+        self.row = -1 # Index in the grid's effects, or -1 if not in the grid
+
+'''
+Component holding every effect, in update order and indexed by cell
+'''
+@enumerate_component("effect_grid")
+class EffectGridComponent():
+    rules: EffectRules
+    effects: list[GridEffect] = factory(list)
+    cells: dict[Cell, list[GridEffect]] = factory(dict)
+
+    '''
+    Adds an effect after those already in the grid
+    '''
+    def add(self, effect: GridEffect):
+        effect.row = len(self.effects)
+        self.effects.append(effect)
+        self.cells.setdefault(effect.cell, []).append(effect)
+
+    '''
+    Removes an effect, moving the last effect into its place. Effects not in the grid are ignored.
+    '''
+    def remove(self, effect: GridEffect):
+        if effect.row < 0:
+            return
+        last = self.effects.pop()
+        if last is not effect:
+            self.effects[effect.row] = last
+            last.row = effect.row
+        effect.row = -1
+
+        effects = self.cells[effect.cell]
+        effects.remove(effect)
+        if not effects:
+            del self.cells[effect.cell]
+
+    '''
+    Advances every effect by a turn, with effect.step_effect.
+    Returns the effects spread to this turn.
+    '''
+    def advance(self, tilemap: TilemapComponent, collision: CollisionComponent) -> list[GridEffect]:
+        names = self.rules.names
+        removed: list[GridEffect] = []
+        spawned: list[GridEffect] = []
+
+        def occupants(cell: Cell):
+            return ((names[other.type], other) for other in self.cells.get(cell, ()))
+
+        def consume(other: GridEffect):
+            other.energy = 0
+            removed.append(other)
+
+        for effect in self.effects:
+            def spawn(cell: Cell, energy: float, shape: int):
+                spawned.append(GridEffect(effect.type, cell, energy, effect.direction, shape))
+
+            rules = self.rules.effects[effect.type]
+            effect.energy = step_effect(tilemap, collision, rules, effect.cell, effect.direction, effect.shape, effect.energy, occupants, consume, spawn)
+            if effect.energy <= 0:
+                removed.append(effect)
+
+        for effect in removed:
+            self.remove(effect)
+        for effect in spawned:
+            self.add(effect)
+        return spawned
+
+    '''
+    Draws every effect, centred on its tile
+    '''
+    def draw(self, surface: Surface, offset: Vector2, scale: float):
+        asset_pipeline = AssetPipeline.get_instance()
+        for t, sprite in enumerate(self.rules.sprites):
+            cells = [ effect.cell for effect in self.effects if effect.type == t ]
+            if not cells:
+                continue
+            scaled_sprite = asset_pipeline.get_scaled_by(sprite, scale / TILE_SCALE)
+            sprite_center = numpy.array(scaled_sprite.get_size()) / 2
+            dests = screen_positions(numpy.array(cells), scale, offset, sprite_center)
+            surface.blits(zip(itertools.repeat(scaled_sprite), dests.tolist()), doreturn=False)
+
+
+'''
+Moves cast effect entities into the grid
+'''
+def absorb_effect_entities(group: EntityGroup, grid: EffectGridComponent):
+    for e in group.query('effect', 'motion'):
+        effect: EffectComponent = e.effect
+        position, direction = e.motion.position, effect.direction
+        grid.add(GridEffect(
+            grid.rules.index[effect.name],
+            (int(position.x), int(position.y)),
+            effect.energy,
+            (int(direction.x), int(direction.y)),
+            effect.shape
+        ))
+        group.remove(e)
+
+'''
+Plays the sound of each effect type that spread this turn, once, at the first tile it spread to
+'''
+def play_spread_sounds(group: EntityGroup, grid: EffectGridComponent, spawned: list[GridEffect]):
+    played = set()
+    for effect in spawned:
+        sound = grid.rules.sounds[effect.type]
+        if sound is None or effect.type in played:
+            continue
+        played.add(effect.type)
+        sound_entity = Entity('sound')
+        sound_entity.sound = SoundComponent(sound_file=sound.sound_file, volume=sound.volume, state=SoundComponent.STATE_PLAY, destroy_after_play=True)
+        sound_entity.motion = MotionComponent(position=Vector2(effect.cell))
+        group.add(sound_entity)
+
+
+'''
+The effect grid system:
+Absorbs newly cast effects, then advances every effect in the grid by a turn
+'''
+def effect_grid_system(group: EntityGroup):
+    grid: EffectGridComponent = group.query_singleton('effect_grid').effect_grid
+    tilemap: TilemapComponent = group.query_singleton('tilemap').tilemap
+    collision: CollisionComponent = group.query_singleton('collision').collision
+
+    absorb_effect_entities(group, grid)
+    if not grid.effects:
+        return
+
+    spawned = grid.advance(tilemap, collision)
+    play_spread_sounds(group, grid, spawned)
+
+
+'''
+Mounts the effect grid system, in place of the effect system
+'''
+def mount_effect_grid_system(group: EntityGroup):
+    e = Entity("effect_grid")
+    e.effect_grid = EffectGridComponent(rules=EffectRules(effect_templates()))
+    group.add(e)
+
+    group.mount_system(effect_grid_system, run_if=turn.in_state(turn.TURN_EFFECTS))
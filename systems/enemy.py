@@ -1,5 +1,7 @@
-from pygame import Vector2
-from engine.ecs import Entity, EntityGroup, enumerate_component
+import heapq
+import numpy
+from pygame import Rect, Vector2
+from engine.ecs import Entity, EntityGroup, enumerate_component, factory
 from systems.sounds import SoundComponent
 from .motion import MotionComponent
 from .sprites import SpriteComponent
@@ -13,7 +15,9 @@ from . import tilemap
 
 from math import copysign
 from random import choice
-from queue import PriorityQueue
+
+PATHING_FLOW_FIELD = 0 # Follow the flow field shared by all enemies
+PATHING_A_STAR = 1 # Search for a path from this enemy alone
 
 '''
 A component that represents a generic enemy
@@ -21,6 +25,89 @@ A component that represents a generic enemy
 @enumerate_component("enemy")
 class EnemyComponent:
     damage: int
+    pathing: int = PATHING_FLOW_FIELD
+    # The A* path cache, see cached_a_star
+    path: list[int] = factory(list)
+    path_key: tuple | None = None
+    path_version: int = 0
+
+'''
+The cost to reach the player from every tile within the map bounds, shared by all enemies.
+It is computed once per turn, with Dijkstra's algorithm outwards from the player, using the same costs as A*.
+Tiles are packed into indices into flat lists, as y * width + x relative to the area.
+'''
+@enumerate_component("flow_field")
+class FlowFieldComponent:
+    area: Rect | None = None
+    costs: list[int] | None = None # The cost of entering each tile
+    distances: list[float] | None = None # The cost of the cheapest path from each tile to the goal
+    goal: tuple[int, int] | None = None
+    turn: int = -1
+
+    def update(self, tilemap: TilemapComponent, goal: tuple[int, int], turn: int):
+        if self.turn == turn and self.goal == goal:
+            return
+        self.turn = turn
+        self.goal = goal
+
+        height, width = tilemap.map.shape
+        self.area = area = tilemap.bounds.clip(Rect(0, 0, width, height))
+        self.costs = costs = COST_LOOKUP[tilemap.region(area)].ravel().tolist()
+        self.distances = distances = [float('inf')] * len(costs)
+
+        gx, gy = goal[0] - area.left, goal[1] - area.top
+        if not (0 <= gx < area.width and 0 <= gy < area.height):
+            return
+
+        # Paths are searched backwards from the goal, so stepping from u to v costs the cost of entering u
+        width = area.width
+        count = len(costs)
+        start = gy * width + gx
+        distances[start] = 0
+        frontier = [(0, start)]
+        while frontier:
+            distance, current = heapq.heappop(frontier)
+            if distance > distances[current]:
+                continue
+
+            distance += costs[current]
+            x = current % width
+            if x > 0 and distance < distances[current - 1]:
+                distances[current - 1] = distance
+                heapq.heappush(frontier, (distance, current - 1))
+            if x < width - 1 and distance < distances[current + 1]:
+                distances[current + 1] = distance
+                heapq.heappush(frontier, (distance, current + 1))
+            if current >= width and distance < distances[current - width]:
+                distances[current - width] = distance
+                heapq.heappush(frontier, (distance, current - width))
+            if current + width < count and distance < distances[current + width]:
+                distances[current + width] = distance
+                heapq.heappush(frontier, (distance, current + width))
+
+    '''
+    Returns the velocity towards the neighbour with the cheapest path to the goal.
+    Ties are broken randomly, as with calculate_velocity.
+    '''
+    def next_velocity(self, position: Vector2) -> Vector2:
+        area = self.area
+        x, y = int(position.x) - area.left, int(position.y) - area.top
+        best = float('inf')
+        moves = []
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < area.width and 0 <= ny < area.height:
+                i = ny * area.width + nx
+                total = self.costs[i] + self.distances[i]
+                if total < best:
+                    best = total
+                    moves = [(dx, dy)]
+                elif total == best:
+                    moves.append((dx, dy))
+
+        if not moves or best == float('inf'):
+            return Vector2(0)
+        return Vector2(choice(moves))
 
 '''
 Update enemy systems including motion and when to do damage to player
@@ -31,12 +118,17 @@ def enemy_update_system(group: EntityGroup):
     player = group.query_singleton('player')
     t: TurnComponent = group.query_singleton('turn').turn
     tm: TilemapComponent = group.query_singleton('tilemap').tilemap
+    flow_field: FlowFieldComponent = group.query_singleton('flow_field').flow_field
 
     for e in group.query('enemy', 'health'):
 
         if t.state == turn.TURN_ENEMY:
             motion: MotionComponent = e.motion
-            mtp = a_star(tm, (e.motion.position.x, e.motion.position.y), (player.motion.position.x, player.motion.position.y))
+            if e.enemy.pathing == PATHING_A_STAR:
+                mtp = cached_a_star(tm, e.enemy, e.motion.position, player.motion.position)
+            else:
+                flow_field.update(tm, (int(player.motion.position.x), int(player.motion.position.y)), t.number)
+                mtp = flow_field.next_velocity(e.motion.position)
             motion.velocity = mtp
 
             if player.motion.position == e.motion.position + mtp:
@@ -44,7 +136,7 @@ def enemy_update_system(group: EntityGroup):
                 group.remove(e)
 
                 hurt_sound = Entity('sound')
-                hurt_sound.sound = SoundComponent(sound_file='assets/sounds/enemy-death.mp3', volume=0.25, state=0, destroy_after_play=True)
+                hurt_sound.sound = SoundComponent(sound_file='sounds/enemy-death.mp3', volume=0.25, state=0, destroy_after_play=True)
                 hurt_sound.motion = MotionComponent(position=e.motion.position)
 
                 group.add(hurt_sound)
@@ -54,7 +146,7 @@ def enemy_update_system(group: EntityGroup):
             group.remove(e)
 
             hurt_sound = Entity('sound')
-            hurt_sound.sound = SoundComponent(sound_file='assets/sounds/enemy-death.mp3', volume=0.25, state=0, destroy_after_play=True)
+            hurt_sound.sound = SoundComponent(sound_file='sounds/enemy-death.mp3', volume=0.25, state=0, destroy_after_play=True)
             hurt_sound.motion = MotionComponent(position=e.motion.position)
 
             group.add(hurt_sound)
@@ -64,7 +156,12 @@ def enemy_update_system(group: EntityGroup):
 Mount system
 '''
 def mount_enemy_system(group: EntityGroup):
-    group.mount_system(enemy_update_system)
+    e = Entity("flow_field")
+    e.flow_field = FlowFieldComponent()
+    group.add(e)
+
+    # Enemies only move, or die, once the player has taken their turn
+    group.mount_system(enemy_update_system, run_if=turn.not_waiting)
 
 '''
 Immediate motion next step for A* calculating the velocity from the
@@ -95,7 +192,7 @@ def create_enemy(position = tuple[int, int]):
     enemy.sprite = SpriteComponent.from_resource("creatures/enemy.png")
     enemy.motion = MotionComponent(layer=motion.LAYER_ENEMIES, position = Vector2(position))
     enemy.health = HealthComponent(health = 100)
-    enemy.sound = SoundComponent(sound_file='assets/sounds/enemy-move.mp3', volume=0.5, state=-1)
+    enemy.sound = SoundComponent(sound_file='sounds/enemy-move.mp3', volume=0.5, state=-1)
 
     return enemy
 
@@ -121,77 +218,140 @@ COST_MAPPING = {
 for tile in tilemap.IMPASSABLE_TILES:
     COST_MAPPING[tile] = 100
 
-'''
-Calculating cost of individual tile for A*
-'''
-def get_cost(value):
-    return COST_MAPPING.get(value, 5)  # Default to infinity for unrecognized values
+# COST_MAPPING as an array indexed by tile, for whole regions at once
+COST_LOOKUP = numpy.full(256, 5, dtype=numpy.int64)
+for tile, cost in COST_MAPPING.items():
+    COST_LOOKUP[tile] = cost
+
+MAX_SEARCH_NODES = 128 * 128 # Nodes A* may expand before giving up and heading for the closest one found
 
 '''
-Heuristic function (Manhattan distance for grid)
+COST_MAPPING applied to the whole map, as a flat list indexed by packed node (y * width + x).
+Rebuilt only when the tilemap changes.
 '''
-def heuristic(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+class CostGrid:
+    def __init__(self):
+        self.map = None
+        self.version = -1
+        self.costs: list[int] = []
+
+    def get(self, tilemap: TilemapComponent) -> list[int]:
+        if self.map is not tilemap.map or self.version != tilemap.version:
+            self.map = tilemap.map
+            self.version = tilemap.version
+            self.costs = COST_LOOKUP[tilemap.map].ravel().tolist()
+        return self.costs
+
+cost_grid = CostGrid()
 
 '''
-A* algorithm implementation including. Returns next immediate velocity for enemy to take
+Finds the cheapest path from start to goal, as a list of packed nodes (y * width + x) beginning with the start.
+Steps are limited to the map bounds. Goals outside the bounds or on impassable tiles are not searched for, and give an empty path.
+If the goal cannot be reached within max_nodes expansions, the path leads to the expanded node closest to the goal instead, and reached is false.
+Returns (path, reached).
 '''
-def a_star(tilemap: TilemapComponent, e_pos, p_pos):
+def find_path(tilemap: TilemapComponent, start: tuple[int, int], goal: tuple[int, int], max_nodes: int = MAX_SEARCH_NODES) -> tuple[list[int], bool]:
+    costs = cost_grid.get(tilemap)
+    height, width = tilemap.map.shape
+    area = tilemap.bounds.clip(Rect(0, 0, width, height))
+    left, right, top, bottom = area.left, area.right - 1, area.top * width, (area.bottom - 1) * width
 
-    frontier = PriorityQueue()
-    frontier.put((0, e_pos))  # Priority queue stores (priority, node)
-    
-    came_from = {}
-    cost_so_far = {}
-    
-    came_from[e_pos] = None
-    cost_so_far[e_pos] = 0
-    
-    while not frontier.empty():
-        _, current = frontier.get()
-        
-        if current == p_pos:
+    sx, sy = start
+    gx, gy = goal
+    if not (0 <= sx < width and 0 <= sy < height):
+        return [], False
+    if not tilemap.is_passable(goal):
+        return [], False
+    start_node = sy * width + sx
+    goal_node = gy * width + gx
+
+    frontier = [(0, start_node)]
+    came_from = {start_node: None}
+    cost_so_far = {start_node: 0}
+    closest = start_node
+    closest_distance = abs(sx - gx) + abs(sy - gy)
+    expanded = 0
+
+    while frontier:
+        _, current = heapq.heappop(frontier)
+        if current == goal_node:
+            closest = current
             break
-        
-        # Define the possible moves (up, down, left, right)
-        neighbors = [
-            (current[0] + 1, current[1]),   # Right 
-            (current[0] - 1, current[1]),   # Left
-            (current[0], current[1] + 1),   # Down
-            (current[0], current[1] - 1)    # Up
-        ]
-        
-        for next in neighbors:
-            # Check if next position is within grid bounds
-
-            if tilemap.contains(next):
-                # Calculate the cost to move to the neighbor
-                # TODO: Check, this might be reversed
-                next_x = int(next[0])
-                next_y = int(next[1])
-                new_cost = cost_so_far[current] + get_cost(tilemap.map[next_y][next_x])
-                
-                # If the neighbor hasn't been visited or a cheaper path is found
-                if next not in cost_so_far or new_cost < cost_so_far[next]:
-                    cost_so_far[next] = new_cost
-                    priority = new_cost + heuristic(p_pos, next)
-                    frontier.put((priority, next))
-                    came_from[next] = current
-    
-    # Reconstruct path
+
+        expanded += 1
+        if expanded > max_nodes:
+            break
+
+        x = current % width
+        row = current - x
+        distance = abs(x - gx) + abs(row // width - gy)
+        if distance < closest_distance:
+            closest, closest_distance = current, distance
+
+        cost = cost_so_far[current]
+        for next, inside in (
+            (current + 1, left <= x + 1 <= right and top <= row <= bottom),         # Right
+            (current - 1, left <= x - 1 <= right and top <= row <= bottom),         # Left
+            (current + width, left <= x <= right and top <= row + width <= bottom), # Down
+            (current - width, left <= x <= right and top <= row - width <= bottom), # Up
+        ):
+            if not inside:
+                continue
+            new_cost = cost + costs[next]
+            if new_cost < cost_so_far.get(next, new_cost + 1):
+                cost_so_far[next] = new_cost
+                came_from[next] = current
+                nx = next % width
+                heapq.heappush(frontier, (new_cost + abs(nx - gx) + abs(next // width - gy), next))
+
+    # Trace the path back from the end to the start
     path = []
-    current = p_pos
-    while current != e_pos:  # Trace the path back from goal to start
+    current = closest
+    while current is not None:
         path.append(current)
         current = came_from[current]
-    path.append(e_pos)
-    path.reverse()  # Reverse the path to start -> goal
+    path.reverse()
+    return path, closest == goal_node
 
-    velocity = Vector2(0)
+'''
+Calculates the velocity for the first step along a path of packed nodes
+'''
+def path_velocity(path: list[int], width: int) -> Vector2:
+    if len(path) < 2:
+        return Vector2(0)
+    return calculate_velocity(
+        Vector2(path[1] % width, path[1] // width),
+        Vector2(path[0] % width, path[0] // width)
+    )
 
-    # Because system uses last two path nodes for A* to calculate next immediate 
-    # vector for enemy to take towards player, with paht[0] being the current position
-    if(len(path)>= 2):
-        velocity = calculate_velocity(Vector2(path[1]), Vector2(path[0]))
-    
-    return velocity  # Return the path and total cost
\ No newline at end of file
+'''
+A* algorithm implementation including. Returns next immediate velocity for enemy to take
+'''
+def a_star(tilemap: TilemapComponent, e_pos, p_pos):
+    path, _ = find_path(tilemap, (int(e_pos[0]), int(e_pos[1])), (int(p_pos[0]), int(p_pos[1])))
+    return path_velocity(path, tilemap.map.shape[1])
+
+'''
+A* for an enemy, reusing the path found on an earlier turn while the goal, the bounds,
+and the tiles along the rest of the path are unchanged
+'''
+def cached_a_star(tilemap: TilemapComponent, enemy: EnemyComponent, e_pos: Vector2, p_pos: Vector2):
+    width = tilemap.map.shape[1]
+    start = (int(e_pos.x), int(e_pos.y))
+    goal = (int(p_pos.x), int(p_pos.y))
+    node = start[1] * width + start[0]
+    key = (goal, tuple(tilemap.bounds))
+
+    path = enemy.path
+    if path and enemy.path_key == key and node in path:
+        path = path[path.index(node):]
+        if tilemap.unchanged_since(enemy.path_version, path):
+            enemy.path = path
+            return path_velocity(path, width)
+
+    path, reached = find_path(tilemap, start, goal)
+    # Partial paths towards an unreachable goal are cheap to find again, and not worth keeping
+    enemy.path = path if reached else []
+    enemy.path_key = key
+    enemy.path_version = tilemap.version
+    return path_velocity(path, width)
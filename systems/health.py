@@ -1,4 +1,5 @@
 from engine.ecs import Entity, EntityGroup, enumerate_component
+from systems.turn import not_waiting
 from systems.motion import MotionComponent
 from systems.sounds import SoundComponent
 
@@ -16,7 +17,7 @@ def update_health_system(group: EntityGroup):
         if e.health.health < e.health.previous_health:
             if e.contains('player'):
                 hurt_sound = Entity('sound')
-                hurt_sound.sound = SoundComponent(sound_file='assets/sounds/player-damage.mp3', volume=0.5, state=0, destroy_after_play=True)
+                hurt_sound.sound = SoundComponent(sound_file='sounds/player-damage.mp3', volume=0.5, state=0, destroy_after_play=True)
                 hurt_sound.motion = MotionComponent(position=e.motion.position)
 
                 group.add(hurt_sound)
@@ -30,6 +31,7 @@ def update_health_system(group: EntityGroup):
 Mount health system
 '''
 def mount_health_system(group: EntityGroup):
-    group.mount_system(update_health_system)
+    # Health only changes during the effect and enemy turns
+    group.mount_system(update_health_system, run_if=not_waiting)
     pass
 
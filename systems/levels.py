@@ -1,6 +1,8 @@
+import functools
 import random
 from pygame import Rect, Surface, Vector2
-from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from engine.assets import AssetLoad
+from engine.ecs import Entity, EntityGroup, Prefab, enumerate_component, factory
 from systems.controls import ControlComponent
 from systems.enemy import create_enemy
 from systems.motion import Direction, MotionComponent
@@ -11,10 +13,15 @@ from systems.ui import UIComponent
 from systems.utils import clamp_vector, round_vector
 
 
-ENEMY_TYPES = {
-    'mook': create_enemy((0, 0)),
-    'boss': create_enemy((0, 0))
-}
+'''
+The enemy prefabs, created the first time a level spawns its enemies
+'''
+@functools.cache
+def enemy_types() -> dict[str, Prefab]:
+    return {
+        'mook': Prefab(create_enemy((0, 0))),
+        'boss': Prefab(create_enemy((0, 0)))
+    }
 
 
 LEVELS = {
@@ -123,6 +130,7 @@ class GameComponent:
     STATE_WIN = 3
 
     state: int = 0
+    loading: AssetLoad | None = None # Assets that must finish loading before the game can start
 
 def level_progression_system(group: EntityGroup):
     game: GameComponent = group.query_singleton('game').game
@@ -145,7 +153,7 @@ def level_progression_system(group: EntityGroup):
         level_config = level.levels.get(level.current_level)
         if not level_config == None:
             map: TilemapComponent = group.query_singleton('tilemap').tilemap
-            map.bounds = Rect(Vector2(len(map.map))/2 - Vector2(level_config['map_bounds']) / 2, level_config['map_bounds'])
+            apply_level_bounds(map, level_config)
             spawn_area = Rect(level_config['spawn_area'])
             spawn_interval = level_config.get('spawn_interval', 5)
             for enemy_type, count in level_config['enemies'].items():
@@ -156,6 +164,29 @@ def level_progression_system(group: EntityGroup):
         else:
             print('Game Over. You win!')
 
+'''
+Sets the map bounds for the given level
+'''
+def apply_level_bounds(map: TilemapComponent, level_config: dict):
+    map.bounds = Rect(Vector2(len(map.map))/2 - Vector2(level_config['map_bounds']) / 2, level_config['map_bounds'])
+
+'''
+Picks a random position in the spawn area, within the map bounds
+'''
+def random_spawn_position(spawn_area: Rect, map_bounds: Rect) -> Vector2:
+    random_spawn = round_vector(Vector2(spawn_area.topleft) + Vector2(spawn_area.size) * random.random())
+    return clamp_vector(random_spawn, Vector2(map_bounds.topleft), Vector2(map_bounds.bottomright) - Vector2(1))
+
+'''
+Spawns every enemy for the given level at once, rather than over the spawn interval
+'''
+def spawn_all_enemies(group: EntityGroup, map: TilemapComponent, level_config: dict):
+    spawn_area = Rect(level_config['spawn_area'])
+    for enemy_type, count in level_config['enemies'].items():
+        for enemy in enemy_types()[enemy_type].instantiate(count):
+            enemy.motion.position = random_spawn_position(spawn_area, map.bounds)
+            group.add(enemy)
+
 def spawn_enemy_system(group: EntityGroup):
     turn: TurnComponent = group.query_singleton('turn').turn
     tilemap: TilemapComponent = group.query_singleton('tilemap').tilemap
@@ -173,12 +204,10 @@ def spawn_enemy_system(group: EntityGroup):
             continue
 
 
-        random_spawn = round_vector(Vector2(spawn_area.topleft) + Vector2(spawn_area.size) * random.random())
-        map_bounds = tilemap.bounds
-        clamped_spawn = clamp_vector(random_spawn, Vector2(map_bounds.topleft), Vector2(map_bounds.bottomright) - Vector2(1))
+        clamped_spawn = random_spawn_position(spawn_area, tilemap.bounds)
         spawn.last_spawned_turn = turn.number
         spawn.count -= 1
-        enemy = ENEMY_TYPES.get(spawn.enemy_type).clone()
+        enemy = enemy_types().get(spawn.enemy_type).create()
         enemy.motion.position = clamped_spawn
         group.add(enemy)
 
@@ -188,6 +217,14 @@ def game_state_system(group: EntityGroup):
     controls: ControlComponent = group.query_singleton('controls').controls
 
     if game.state == game.STATE_START_SCREEN:
+        if game.loading is not None:
+            if not game.loading.done():
+                game_entity.ui.text = f'Loading... {game.loading.progress():.0%}'
+                return
+            game.loading.wait()
+            game.loading = None
+            game_entity.ui.text = 'Press any key to start'
+
         if len(controls.actions) > 0:    
             game.state = game.STATE_PLAYING
             game_entity.ui.text = ''
@@ -212,11 +249,14 @@ def game_state_system(group: EntityGroup):
         group.add(game_over)
     
 
-def mount_level_system(group: EntityGroup, surface: Surface):
+'''
+Mounts the level systems. If assets are still loading, the start screen shows their progress and waits for them.
+'''
+def mount_level_system(group: EntityGroup, surface: Surface, loading: AssetLoad | None = None):
     game_entity = Entity('game')
-    game_entity.game = GameComponent()
+    game_entity.game = GameComponent(loading=loading)
     game_entity.motion = MotionComponent(position=surface.get_rect().center - Vector2(100, 0))
-    game_entity.ui = UIComponent(text='Press any key to start')
+    game_entity.ui = UIComponent(text='Loading...' if loading is not None else 'Press any key to start')
 
     group.add(game_entity)
 
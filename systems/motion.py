@@ -2,7 +2,7 @@ from enum import Enum
 from engine.ecs import EntityGroup, enumerate_component, factory
 from pygame import Vector2
 
-from .turn import TurnComponent
+from .turn import TurnComponent, not_waiting
 from .tilemap import TilemapComponent
 #from .collision import CollisionComponent
 from . import utils
@@ -48,6 +48,7 @@ def motion_update_system(group: EntityGroup):
             new_position = motion.position + motion.velocity
             if tilemap.is_passable(new_position) and not collision.is_occupied(new_position, motion.layer):
                 motion.position = new_position
+                collision.queue_move(e)
             motion.velocity = Vector2(0)
             if e.contains('sound'):
                 e.sound.state = e.sound.STATE_PLAY
@@ -56,5 +57,5 @@ def motion_update_system(group: EntityGroup):
 Mounts systems for updating motion components
 '''
 def mount_motion_system(group: EntityGroup):
-    group.mount_system(motion_update_system)
+    group.mount_system(motion_update_system, run_if=not_waiting)
 
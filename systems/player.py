@@ -74,15 +74,22 @@ def player_update_system(group: EntityGroup):
 
 
 '''
-Adds the player character, and mounts systems for updating the player with the control inputs
+Creates the player character
 '''
-def mount_player_system(group: EntityGroup):
+def create_player() -> Entity:
     player = Entity("player")
     player.player = PlayerComponent()
     player.motion = MotionComponent(layer=motion.LAYER_PLAYER, position=Vector2(64,64))
     player.sprite = SpriteComponent.from_resource("player/player_down.png")
     player.health = HealthComponent(health = 100)
-    player.sound = SoundComponent(sound_file='assets/sounds/step.mp3', volume=0.5, state=-1)
+    player.sound = SoundComponent(sound_file='sounds/step.mp3', volume=0.5, state=-1)
+    return player
+
+'''
+Adds the player character, and mounts systems for updating the player with the control inputs
+'''
+def mount_player_system(group: EntityGroup):
+    player = create_player()
     group.add(player)
 
     health_box = Entity("health_box")
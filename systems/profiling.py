@@ -0,0 +1,52 @@
+from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from engine.profiler import Profiler
+from pygame import Vector2
+
+from .motion import MotionComponent
+from .ui import UIComponent
+
+OVERLAY_LINES = 8
+OVERLAY_POSITION = Vector2(10, 170)
+OVERLAY_LINE_HEIGHT = 24
+
+'''
+Component holding the profiler, and the ui entities used to display it
+'''
+@enumerate_component("profiler")
+class ProfilerComponent():
+    profiler: Profiler
+    lines: list[Entity] = factory(list)
+
+'''
+The profiler overlay system:
+Writes the slowest systems into the overlay ui entities
+'''
+def profiler_overlay_system(group: EntityGroup):
+    overlay: ProfilerComponent = group.query_singleton('profiler').profiler
+    profiles = overlay.profiler.slowest()
+
+    frame_ms = sum(p.recent_ms() for p in profiles)
+    overlay.lines[0].ui.text = f"Frame: {frame_ms:.2f} ms"
+
+    for i, line in enumerate(overlay.lines[1:]):
+        if i < len(profiles):
+            p = profiles[i]
+            line.ui.text = f"{p.name}: {p.recent_ms():.2f} ms, {p.entities // max(p.calls, 1)} entities"
+        else:
+            line.ui.text = ""
+
+'''
+Mounts the profiler overlay. This should be mounted before the ui system.
+'''
+def mount_profiler_system(group: EntityGroup, profiler: Profiler):
+    e = Entity("profiler")
+    e.profiler = ProfilerComponent(profiler=profiler)
+    for i in range(OVERLAY_LINES):
+        line = Entity("profiler_line")
+        line.ui = UIComponent(text="")
+        line.motion = MotionComponent(position=OVERLAY_POSITION + Vector2(0, i * OVERLAY_LINE_HEIGHT))
+        e.profiler.lines.append(line)
+        group.add(line)
+    group.add(e)
+
+    group.mount_system(profiler_overlay_system)
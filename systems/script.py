@@ -0,0 +1,146 @@
+from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from pygame import Vector2
+
+from .controls import ControlComponent
+from .effect import create_effect, effect_templates
+from .levels import GameComponent
+from .player import get_direction_command
+from .tilemap import TilemapComponent
+from . import turn
+from . import utils
+
+CAST_SEARCH_RADIUS = 8
+
+'''
+The script used when none is supplied.
+Each line is one player turn, and the script repeats once it runs out.
+'''
+DEFAULT_SCRIPT = [
+    "up",
+    "cast wave 1 0 1 0",
+    "left",
+    "cast growth 0 1 0 1",
+    "down",
+    "cast fire 0 -1 0 -1",
+    "right",
+    "cast corrupt -1 0 -1 0",
+    "skip",
+]
+
+'''
+Component holding a scripted sequence of player turns.
+A step is one of:
+    up | down | left | right    Move the player
+    skip                        Pass the turn
+    cast <effect> <x> <y> <dx> <dy>
+                                Cast an effect at an offset from the player, in the given direction.
+                                If the target tile cannot be cast from, the turn is passed.
+    cast <effect>               Cast an effect at the nearest tile it can be cast from, directed away from the player.
+'''
+@enumerate_component("script")
+class ScriptComponent():
+    steps: list[str] = factory(list)
+    index: int = 0
+
+    def next_step(self) -> list[str]:
+        step = self.steps[self.index % len(self.steps)]
+        self.index += 1
+        return step.split()
+
+
+'''
+Reads a script file, one step per line. Blank lines and lines starting with # are ignored.
+'''
+def load_script(path: str) -> list[str]:
+    with open(path) as f:
+        lines = [ line.strip() for line in f ]
+    return [ line for line in lines if line and not line.startswith("#") ]
+
+
+'''
+Finds the nearest tile to the position that is one of the given tiles, searching outwards in square rings
+'''
+def find_nearest_tile(tilemap: TilemapComponent, position: Vector2, tiles: list[int], radius: int = CAST_SEARCH_RADIUS) -> Vector2 | None:
+    for r in range(1, radius + 1):
+        for y in range(-r, r + 1):
+            for x in range(-r, r + 1):
+                if max(abs(x), abs(y)) != r:
+                    continue
+                coord = position + Vector2(x, y)
+                if tilemap.get_tile(coord) in tiles:
+                    return coord
+    return None
+
+'''
+Casts an effect for a scripted step. Returns false if there is no tile to cast from.
+'''
+def cast_step(group: EntityGroup, position: Vector2, args: list[str]) -> bool:
+    tilemap: TilemapComponent = group.query_singleton('tilemap').tilemap
+    effect = args[0]
+    cast_from = effect_templates()[effect].effect.cast_from
+
+    if len(args) == 1:
+        target = find_nearest_tile(tilemap, position, cast_from)
+        if target is None:
+            return False
+        direction = utils.closest_cardinal(target - position)
+    else:
+        x, y, dx, dy = args[1:]
+        target = position + Vector2(int(x), int(y))
+        direction = Vector2(int(dx), int(dy))
+        if tilemap.get_tile(target) not in cast_from:
+            return False
+
+    group.add(create_effect(effect, target, direction))
+    return True
+
+
+'''
+The script input system:
+Plays the next scripted step whenever the player is due to take a turn.
+This stands in for the controls and player systems when running without a display.
+'''
+def script_input_system(group: EntityGroup):
+    game: GameComponent = group.query_singleton('game').game
+    controls: ControlComponent = group.query_singleton('controls').controls
+    if game.state == GameComponent.STATE_START_SCREEN:
+        # Any input will start the game
+        controls.actions = ["script"]
+        return
+    controls.actions = []
+
+    t: turn.TurnComponent = group.query_singleton('turn').turn
+    if t.state != turn.TURN_PLAYER or not t.waiting:
+        return
+
+    player = group.query_singleton('player', 'motion', 'health')
+    if not player.health.is_alive:
+        game.state = GameComponent.STATE_GAME_OVER
+        return
+
+    script: ScriptComponent = group.query_singleton('script').script
+    step = script.next_step()
+    action = step[0]
+    if action == "cast":
+        cast_step(group, player.motion.position, step[1:])
+    elif action != "skip":
+        direction = get_direction_command([action + "_start"])
+        if direction is None:
+            raise ValueError(f"Unknown script step: {' '.join(step)}")
+        player.motion.velocity = direction
+    t.waiting = False
+
+
+'''
+Mounts the script system, along with the controls it writes to
+'''
+def mount_script_system(group: EntityGroup, steps: list[str] = DEFAULT_SCRIPT):
+    script = Entity("script")
+    script.script = ScriptComponent(steps=list(steps))
+    group.add(script)
+
+    controls = Entity("controls")
+    controls.controls = ControlComponent()
+    group.add(controls)
+
+    group.mount_system(script_input_system)
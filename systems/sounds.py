@@ -3,6 +3,7 @@
 import random
 from pygame import Vector2
 import pygame
+from engine.assets import AssetPipeline
 from engine.ecs import Entity, EntityGroup, enumerate_component
 from systems.controls import ControlComponent
 from systems.motion import MotionComponent
@@ -22,11 +23,29 @@ class SoundComponent:
     state: int = -1
     destroy_after_play: bool = False
 
+MAX_VOICES = 16 # Sounds that can play at once. Further sounds are dropped until a channel is free.
+SOUND_MAX_TIME = 2000 # Milliseconds
+
+'''
+Plays sounds through a fixed pool of mixer channels.
+The decoded sounds are shared, so the volume is set on the channel rather than the sound.
+'''
+def play_pooled(sound: pygame.mixer.Sound, volume: float) -> bool:
+    channel = mixer.find_channel()
+    if channel is None:
+        return False
+    channel.set_volume(volume)
+    channel.play(sound, 0, SOUND_MAX_TIME)
+    return True
+
 def play_sound_system(group: EntityGroup):
     player_entity = group.query_singleton('player', 'motion')
     player_motion: MotionComponent = player_entity.motion
     controls: ControlComponent = group.query_singleton('controls').controls
 
+    # The loudest volume of each sound started this frame. The same sound is only started once per frame.
+    started: dict[str, float] = {}
+
     for entity in group.query('sound', 'motion'):
         sound: SoundComponent = entity.sound
         motion: MotionComponent = entity.motion
@@ -36,18 +55,38 @@ def play_sound_system(group: EntityGroup):
             distance = player_motion.position.distance_to(motion.position)
             if distance < SOUND_AUDIBLE_DISTANCE:
                 sound.state = SoundComponent.STATE_STOPPED
-                sound_file = pygame.mixer.Sound(sound.sound_file)
-                sound_file.set_volume(sound.volume * (1 - distance / SOUND_AUDIBLE_DISTANCE))
-                sound_file.play(0, 2000)
+                volume = sound.volume * (1 - distance / SOUND_AUDIBLE_DISTANCE)
+                if volume > started.get(sound.sound_file, -1):
+                    started[sound.sound_file] = volume
             if sound.destroy_after_play:
                 group.remove(entity)
 
+    asset_pipeline = AssetPipeline.get_instance()
+    for sound_file, volume in started.items():
+        play_pooled(asset_pipeline.get_sound(sound_file), volume)
+
 def create_sound(sound_file: str, volume: float = 1.0, position = Vector2(0, 0)):
     sound_entity = Entity('sound')
     sound_entity.sound = SoundComponent(sound_file, volume)
     sound_entity.motion = MotionComponent(position)
 
+'''
+Discards sounds without playing them, for when there is no audio device.
+Sounds that would be destroyed after playing are still removed.
+'''
+def silent_sound_system(group: EntityGroup):
+    for entity in group.query('sound'):
+        sound: SoundComponent = entity.sound
+        if sound.state == SoundComponent.STATE_PLAY:
+            sound.state = SoundComponent.STATE_STOPPED
+            if sound.destroy_after_play:
+                group.remove(entity)
+
+def mount_silent_sound_system(group: EntityGroup):
+    group.mount_system(silent_sound_system)
+
 def mount_sound_system(group: EntityGroup):
     mixer.init()
+    mixer.set_num_channels(MAX_VOICES)
 
     group.mount_system(play_sound_system)
\ No newline at end of file
@@ -30,37 +30,72 @@ class SelectedSpellComponent:
 @enumerate_component("tile_area")
 class TileAreaComponent:
     tile_positions: list[Vector2] = factory(list)
+    # The tile positions are kept until the key (player position, bounds and target tiles) changes,
+    # or any of the watched tiles change after the version they were found at
+    key: tuple | None = None
+    version: int = 0
+    watched: list[int] = factory(list) # Packed map indices (y * width + x) of the area and the tiles bordering it
+
+
+'''
+Flood fills outwards from coords, over the connected tiles matching value.
+Tiles in checked are skipped, and the tiles found are added to it, so repeated fills do not overlap.
+Returns the matching positions.
+'''
+def find_positions(map: TilemapComponent, coords: Vector2, value, checked: set[tuple[int, int]] | None = None) -> list[Vector2]:
+    if checked is None:
+        checked = set()
+    start = (int(coords[0]), int(coords[1]))
+    if start in checked or map.get_tile(start) != value:
+        return []
 
-
-def find_positions(map: TilemapComponent, coords: Vector2, value, checked = []):
-    tile = map.get_tile(coords)
     positions = []
-
-    if tile == value and coords not in checked:
-        positions.append(coords)
-
-        for check_coord in utils.vector_cardinals(coords):
-            if check_coord in checked:
-                continue
-
-            positions += find_positions(map, check_coord, value, checked + positions)
+    checked.add(start)
+    frontier = [start]
+    while frontier:
+        x, y = frontier.pop()
+        positions.append(Vector2(x, y))
+        for neighbour in ((x + 1, y), (x, y + 1), (x - 1, y), (x, y - 1)):
+            if neighbour not in checked and map.get_tile(neighbour) == value:
+                checked.add(neighbour)
+                frontier.append(neighbour)
 
     return positions
 
+'''
+Packs the positions into map indices, leaving out any outside the map
+'''
+def pack_positions(map: TilemapComponent, positions) -> list[int]:
+    height, width = map.map.shape
+    return [ y * width + x for x, y in positions if 0 <= x < width and 0 <= y < height ]
+
 def spell_tile_detection_system(group: EntityGroup):
     motion: MotionComponent = group.query_singleton('player', 'motion').motion
     tilemap: TilemapComponent = group.query_singleton('tilemap').tilemap
     selected_spell_entity = group.query_singleton('selected_spell', 'tile_area')
     selected_spell: SelectedSpellComponent = selected_spell_entity.selected_spell
     tile_area: TileAreaComponent = selected_spell_entity.tile_area
-    positions = []
 
+    key = (tuple(motion.position), tuple(tilemap.bounds), tuple(selected_spell.target_tile or ()))
+    if tile_area.key == key and tilemap.unchanged_since(tile_area.version, tile_area.watched):
+        return
+
+    positions = []
+    checked = set()
     for v in utils.vector_cardinals(motion.position):
         tile = tilemap.get_tile(v)
         if tile in selected_spell.target_tile:
-            positions += find_positions(tilemap, v, tile, positions)
+            positions += find_positions(tilemap, v, tile, checked)
+
+    # The area changes if a tile in it changes, or a tile around it (or next to the player) becomes a target
+    checked.update((int(v.x), int(v.y)) for v in utils.vector_cardinals(motion.position))
+    for position in positions:
+        checked.update((int(v.x), int(v.y)) for v in utils.vector_cardinals(position))
 
     tile_area.tile_positions = positions
+    tile_area.key = key
+    tile_area.version = tilemap.version
+    tile_area.watched = pack_positions(tilemap, checked)
     
 
 def spell_select_system(group: EntityGroup):
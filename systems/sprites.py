@@ -1,13 +1,17 @@
 from engine.assets import AssetPipeline
+from engine.atlas import Atlas, atlas_keys, build_atlas
 from engine.ecs import Entity, EntityGroup, enumerate_component
+import itertools
 import os
 import math
 
+import numpy
+
 import pygame
 from pygame.surface import Surface
-from pygame import Color, Vector2
+from pygame import Color, Rect, Vector2
 
-from systems.tilemap import TILE_SPRITES, TilemapComponent
+from systems.tilemap import TILE_SPRITE_FILES, TilemapComponent, tile_sprites
 
 from .motion import MotionComponent
 
@@ -19,6 +23,7 @@ A component that contains sprite information
 @enumerate_component("sprite")
 class SpriteComponent():
     surface: Surface
+    resource: str | None = None # The asset key of the surface, if it was loaded from one
 
     '''
     Creates a sprite from a resource file
@@ -27,7 +32,7 @@ class SpriteComponent():
     def from_resource(resource: str) -> 'SpriteComponent':
         asset_pipeline = AssetPipeline.get_instance()
         surface = asset_pipeline.get_image(resource)
-        return SpriteComponent(surface=surface)
+        return SpriteComponent(surface=surface, resource=resource)
 
     '''
     Creates a filled square as a sprite
@@ -49,6 +54,138 @@ class SpriteComponent():
 
 
 TILE_SCALE = 32
+ATLAS_SETTLE_FRAMES = 15 # Frames a new camera scale has to hold before an atlas is packed for it
+
+'''
+A component that holds the tilemap pre-rendered at the camera scale.
+Only tiles marked dirty are redrawn, unless the bounds, scale or screen position change.
+'''
+@enumerate_component("tilemap_layer")
+class TilemapLayerComponent():
+    surface: Surface = None
+    bounds: Rect = None
+    scale: float = 0
+    offset: Vector2 = None # Screenspace offset the layer was drawn for
+
+    def needs_rebuild(self, bounds: Rect, scale: float, offset: Vector2) -> bool:
+        return self.surface is None or self.bounds != bounds or self.scale != scale or self.offset != offset
+
+    '''
+    The screen position of a tile, as if it was drawn to the screen individually
+    '''
+    def tile_position(self, x: int, y: int) -> tuple[int, int]:
+        screen_pos = Vector2(x, y) * self.scale + self.offset - Vector2(self.scale / 2)
+        return int(screen_pos.x), int(screen_pos.y)
+
+    '''
+    The screen position of the layer
+    '''
+    def position(self) -> tuple[int, int]:
+        return self.tile_position(self.bounds.left, self.bounds.top)
+
+    '''
+    Redraws the whole layer for the given bounds and scale
+    '''
+    def rebuild(self, tilemap: TilemapComponent, scale: float, offset: Vector2, atlas: Atlas | None):
+        self.bounds = Rect(tilemap.bounds)
+        self.scale = scale
+        self.offset = Vector2(offset)
+        size = (math.ceil(self.bounds.width * scale) + 1, math.ceil(self.bounds.height * scale) + 1)
+        self.surface = Surface(size)
+        tiles = tilemap.region(self.bounds)
+        ys, xs = numpy.indices(tiles.shape)
+        coords = numpy.stack((xs.ravel() + self.bounds.left, ys.ravel() + self.bounds.top), axis=1)
+        # Positioned as per tile_position, relative to the layer
+        dests = screen_positions(coords, scale, self.offset, scale / 2) - self.position()
+
+        sources = tile_source_lookup(atlas, scale)[tiles.ravel()]
+        self.surface.blits(((source, dest, area) for (source, area), dest in zip(sources.tolist(), dests.tolist())), doreturn=False)
+        tilemap.dirty.clear()
+
+    '''
+    Redraws only the tiles that have changed.
+    Tiles overlap their neighbours by up to a pixel, so the area of each changed tile is cleared
+    and all the tiles overlapping it are redrawn in their original order.
+    '''
+    def update(self, tilemap: TilemapComponent, atlas: Atlas | None):
+        sources = tile_source_lookup(atlas, self.scale)
+        layer_x, layer_y = self.position()
+        tile_size = math.ceil(self.scale)
+        for x, y in tilemap.dirty:
+            if not self.bounds.collidepoint(x, y):
+                continue
+            tile_x, tile_y = self.tile_position(x, y)
+            self.surface.set_clip(Rect(tile_x - layer_x, tile_y - layer_y, tile_size, tile_size))
+            self.surface.fill((0, 0, 0))
+            for ny in range(y - 1, y + 2):
+                for nx in range(x - 1, x + 2):
+                    if self.bounds.collidepoint(nx, ny):
+                        self.draw_tile(sources, tilemap.map.item(ny, nx), nx, ny)
+        self.surface.set_clip(None)
+        tilemap.dirty.clear()
+
+    def draw_tile(self, sources: numpy.ndarray, tile: int, x: int, y: int):
+        # Positioned as if each tile was drawn to the screen individually, so the tiles overlap the same way
+        tile_x, tile_y = self.tile_position(x, y)
+        layer_x, layer_y = self.position()
+        source, area = sources[tile]
+        self.surface.blit(source, (tile_x - layer_x, tile_y - layer_y), area)
+
+'''
+The area of the atlas holding each tile sprite (and the unknown tile, keyed by None)
+'''
+def tile_areas(atlas: Atlas) -> dict[int | None, Rect]:
+    areas: dict[int | None, Rect] = { tile: atlas.area(key) for tile, key in TILE_SPRITE_FILES.items() }
+    areas[None] = atlas.area('tiles/unknown.png')
+    return areas
+
+'''
+The tile sprites scaled to fill a tile (and the unknown tile, keyed by None), for drawing without an atlas
+'''
+def scaled_tile_sprites(scale: float) -> dict[int | None, Surface]:
+    asset_pipeline = AssetPipeline.get_instance()
+    tile_size = (math.ceil(scale), math.ceil(scale))
+    sprites: dict[int | None, Surface] = { tile: asset_pipeline.get_scaled(sprite, tile_size) for tile, sprite in tile_sprites().items() }
+    sprites[None] = asset_pipeline.get_scaled(asset_pipeline.get_image('tiles/unknown.png'), tile_size)
+    return sprites
+
+'''
+The surface and area to blit for every possible tile value, as an array that can be indexed by an array of tiles.
+Tiles are drawn from their area of the atlas, or from the individually scaled sprites (with no area) without one.
+'''
+def tile_source_lookup(atlas: Atlas | None, scale: float) -> numpy.ndarray:
+    if atlas is not None:
+        sources = { tile: (atlas.surface, area) for tile, area in tile_areas(atlas).items() }
+    else:
+        sources = { tile: (sprite, None) for tile, sprite in scaled_tile_sprites(scale).items() }
+    lookup = numpy.empty(256, dtype=object)
+    for tile in range(len(lookup)):
+        lookup[tile] = sources.get(tile) or sources[None]
+    return lookup
+
+'''
+The integer screen positions of sprites drawn at map positions, an array of [x, y] rows.
+This is position * scale + offset - center, truncated towards zero as blit truncates a float position.
+'''
+def screen_positions(positions: numpy.ndarray, scale: float, offset: Vector2, centers: numpy.ndarray | float) -> numpy.ndarray:
+    return (positions * scale + (offset.x, offset.y) - centers).astype(int)
+
+'''
+The size each sprite is packed into the atlas at for the scale.
+Tiles fill a tile, and other sprites are scaled by the scale relative to TILE_SCALE, as per AssetPipeline.get_scaled_by.
+'''
+def atlas_sizes(scale: float) -> dict[str, tuple[int, int]]:
+    asset_pipeline = AssetPipeline.get_instance()
+    tile_size = (math.ceil(scale), math.ceil(scale))
+    factor = scale / TILE_SCALE
+    sizes = {}
+    for key in atlas_keys():
+        if key.startswith('tiles/'):
+            sizes[key] = tile_size
+        else:
+            width, height = asset_pipeline.get_image(key).get_size()
+            sizes[key] = (int(width * factor), int(height * factor))
+    return sizes
 
 '''
 A component that represents a camera
@@ -57,6 +194,36 @@ A component that represents a camera
 class CameraComponent():
     surface: Surface
     scale: float = TILE_SCALE
+    atlas: Atlas = None # The sprites packed at the scale (and display format) given by atlas_key
+    atlas_key: tuple = None
+    pending_key: tuple = None # A changed atlas key, waiting to settle before an atlas is packed for it
+    pending_frames: int = 0
+
+    '''
+    Returns the atlas of sprites at the camera scale, packing a new one if the scale or display format has changed.
+    Atlases are packed at the scale rounded up to a whole pixel, so close window sizes share one.
+
+    The first atlas is packed straight away. After that, a changed key has to be requested for ATLAS_SETTLE_FRAMES
+    frames before it is packed, so resizing the window doesn't pack an atlas for every size it passes through.
+    Until then this returns None, and sprites are drawn without an atlas.
+    '''
+    def get_atlas(self) -> Atlas | None:
+        atlas_scale = math.ceil(self.scale)
+        key = (atlas_scale, AssetPipeline.get_instance().display_format)
+        if self.atlas_key == key:
+            return self.atlas
+
+        if self.pending_key != key:
+            self.pending_key = key
+            self.pending_frames = 0
+        self.pending_frames += 1
+        if self.atlas is not None and self.pending_frames < ATLAS_SETTLE_FRAMES:
+            return None
+
+        self.atlas = build_atlas(atlas_sizes(atlas_scale))
+        self.atlas_key = key
+        self.pending_key = None
+        return self.atlas
 
     def get_screenspace_transform(self, pos: Vector2) -> tuple[Vector2, float]:
         screen_center = Vector2(self.surface.get_size()) / 2
@@ -68,43 +235,63 @@ Use the camera position to draw all entities with a sprite at their relative loc
 '''
 def draw_sprite_system(group: EntityGroup):
 
-    camera = group.query_singleton('camera', 'motion')
+    camera = group.query_singleton('camera', 'motion', 'tilemap_layer')
     tilemap: TilemapComponent = group.query_singleton('tilemap').tilemap
+    layer: TilemapLayerComponent = camera.tilemap_layer
     
     surface: Surface = camera.camera.surface
     offset, scale = camera.camera.get_screenspace_transform(camera.motion.position)
+    # There are no tiles to draw until a level sets the bounds. The start screen's scale is the whole screen,
+    # so the atlas would be huge, and packing it would wait on every preloading image.
+    has_bounds = tilemap.bounds.width > 0 and tilemap.bounds.height > 0
+    atlas = camera.camera.get_atlas() if has_bounds else None
 
     asset_pipeline = AssetPipeline.get_instance()
-    tile_size = Vector2(math.ceil(scale))
-    scaled_sprites = {key: pygame.transform.scale(sprite, tile_size) for key, sprite in TILE_SPRITES.items()}
-    unknown_sprite = pygame.transform.scale(asset_pipeline.get_image('tiles/unknown.png'), tile_size)
     selected_spell = group.query_singleton('selected_spell').selected_spell
     
     if selected_spell.target_tile:
         for i, tile in enumerate(selected_spell.target_tile):
-            hint_sprite = TILE_SPRITES.get(tile) or asset_pipeline.get_image('tiles/unknown.png')
+            hint_sprite = tile_sprites().get(tile) or asset_pipeline.get_image('tiles/unknown.png')
             hint_pos = (10 + i * 40, 95)
             surface.blit(hint_sprite, hint_pos)
 
-    tile_center = Vector2(scale / 2)
-    for y in range(tilemap.bounds.left, tilemap.bounds.right):
-        for x in range(tilemap.bounds.top, tilemap.bounds.bottom):
-            tile = tilemap.get_tile((x,y))
-            scaled_sprite = scaled_sprites.get(tile) or unknown_sprite
-            screen_pos = Vector2(x,y) * scale + offset
-            surface.blit(scaled_sprite, screen_pos - tile_center)
-
-    for e in sorted((e for e in group.query('sprite', 'motion') if (e.motion.layer != None)), key = lambda e: -e.motion.layer):
-        
-        motion: MotionComponent = e.motion
+    if has_bounds:
+        if layer.needs_rebuild(tilemap.bounds, scale, offset):
+            layer.rebuild(tilemap, scale, offset, atlas)
+        elif tilemap.dirty:
+            layer.update(tilemap, atlas)
+
+        surface.blit(layer.surface, layer.position())
+
+    # Effects held in an effect grid are drawn beneath the entities, as the effects layer is the lowest
+    for grid_entity in group.query('effect_grid'):
+        grid_entity.effect_grid.draw(surface, offset, scale)
+
+    # Sprites loaded from the atlas are drawn from their area of it, and any others (or all, without an atlas) are scaled individually.
+    # They are batched into a single blits call, in layer order.
+    entities = sorted((e for e in group.query('sprite', 'motion') if (e.motion.layer != None)), key = lambda e: -e.motion.layer)
+    if not entities:
+        return
+    sources = []
+    areas = []
+    sizes = []
+    for e in entities:
         sprite: SpriteComponent = e.sprite
-        
-        scaled_sprite = pygame.transform.scale_by(sprite.surface, scale / TILE_SCALE)
-        screen_pos = motion.position * scale + offset
-        sprite_center = Vector2(scaled_sprite.get_size())/2
+        if atlas is not None and sprite.resource in atlas:
+            area = atlas.area(sprite.resource)
+            sources.append(atlas.surface)
+            areas.append(area)
+            sizes.append(area.size)
+        else:
+            scaled_sprite = asset_pipeline.get_scaled_by(sprite.surface, scale / TILE_SCALE)
+            sources.append(scaled_sprite)
+            areas.append(None)
+            sizes.append(scaled_sprite.get_size())
 
-        # Note, we are ignoring any screen-space culling
-        surface.blit(scaled_sprite, screen_pos - sprite_center)
+    # Note, we are ignoring any screen-space culling
+    positions = numpy.array([ (e.motion.position.x, e.motion.position.y) for e in entities ])
+    dests = screen_positions(positions, scale, offset, numpy.array(sizes) / 2)
+    surface.blits(zip(sources, dests.tolist(), areas), doreturn=False)
 
 def camera_update_system(group: EntityGroup):
     camera_entity = group.query_singleton('camera', 'motion')
@@ -116,7 +303,11 @@ def camera_update_system(group: EntityGroup):
 
     camera_motion.position = tilemap.bounds.topleft + (Vector2(tilemap.bounds.width) - Vector2(1)) / 2
     scale_size = min(camera.surface.get_width(), camera.surface.get_height())
-    camera.scale = scale_size if tilemap.bounds.width == 0 else scale_size / tilemap.bounds.width
+    scale = scale_size if tilemap.bounds.width == 0 else scale_size / tilemap.bounds.width
+    if scale != camera.scale:
+        # The scaled sprites are no longer needed at the old scale (such as after a window resize)
+        AssetPipeline.get_instance().clear_scaled()
+    camera.scale = scale
 
     
 
@@ -127,6 +318,7 @@ def mount_sprite_system(group: EntityGroup, target: Surface):
     camera = Entity("camera")
     camera.camera = CameraComponent(surface=target)
     camera.motion = MotionComponent(position=Vector2(0,0))
+    camera.tilemap_layer = TilemapLayerComponent()
     group.add(camera)
 
     group.mount_system(camera_update_system)
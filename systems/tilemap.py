@@ -1,6 +1,12 @@
 from typing import Union
-from pygame import Color, Vector2, image, Rect
-from engine.assets import AssetPipeline
+import functools
+import hashlib
+import os
+import struct
+import numpy
+import pygame
+from pygame import Color, Surface, Vector2, image, Rect
+from engine.assets import AssetPipeline, file_hash
 from engine.ecs import enumerate_component, factory
 
 TILE_EARTH = 0
@@ -16,17 +22,19 @@ TILE_ASH = 9
 TILE_MARSH = 10
 TILE_OOZE = 11
 TILE_BONES = 12
+TILE_NONE = 255 # Returned by bulk accessors for coordinates outside the bounds
 
-type Tilemap = list[list[int]]
+# Tiles are stored as a uint8 array, indexed [y, x]
+type Tilemap = numpy.ndarray
 # We may want to make this a literal and/or use an enum
 type Tile = int
 
-def rgb_key(rgba: tuple[int, int, int, int]):
-    key = ''
-    for part in rgba:
-        key += '_' + str(part)
-
-    return key
+'''
+Packs an RGBA colour into a single integer
+'''
+def rgb_key(rgba: tuple[int, int, int, int]) -> int:
+    r, g, b, a = rgba
+    return (r << 24) | (g << 16) | (b << 8) | a
 
 TILE_COLOR_MAP = {
     rgb_key(Color('#67584b')): TILE_EARTH,
@@ -43,24 +51,38 @@ TILE_COLOR_MAP = {
     rgb_key(Color('#d30b91')): TILE_OOZE,
 }
 
+# The colour keys sorted, with their tiles, for vectorized lookups
+TILE_COLOR_KEYS = numpy.array(sorted(TILE_COLOR_MAP), dtype=numpy.uint32)
+TILE_COLOR_TILES = numpy.array([ TILE_COLOR_MAP[key] for key in TILE_COLOR_KEYS.tolist() ], dtype=numpy.uint8)
+
 asset_pipeline = AssetPipeline.get_instance()
 
-TILE_SPRITES = {
-    TILE_EARTH: asset_pipeline.get_image('tiles/earth.png'),
-    TILE_WATER: asset_pipeline.get_image('tiles/water.png'),
-    TILE_MUD: asset_pipeline.get_image('tiles/mud.png'),
-    TILE_PLANT: asset_pipeline.get_image('tiles/plant.png'),
-    TILE_EMBER: asset_pipeline.get_image('tiles/ember.png'),
-    TILE_ASH: asset_pipeline.get_image('tiles/ash.png'),
-    TILE_HELLSCAPE: asset_pipeline.get_image('tiles/hellscape.png'),
-    TILE_ICE: asset_pipeline.get_image('tiles/ice.png'),
-    TILE_LAVA: asset_pipeline.get_image('tiles/lava.png'),
-    TILE_MARSH: asset_pipeline.get_image('tiles/marsh.png'),
-    TILE_OOZE: asset_pipeline.get_image('tiles/ooze.png'),
-    TILE_ROCK: asset_pipeline.get_image('tiles/rock.png'),
-    TILE_BONES: asset_pipeline.get_image('tiles/bones.png'),
+TILE_SPRITE_FILES = {
+    TILE_EARTH: 'tiles/earth.png',
+    TILE_WATER: 'tiles/water.png',
+    TILE_MUD: 'tiles/mud.png',
+    TILE_PLANT: 'tiles/plant.png',
+    TILE_EMBER: 'tiles/ember.png',
+    TILE_ASH: 'tiles/ash.png',
+    TILE_HELLSCAPE: 'tiles/hellscape.png',
+    TILE_ICE: 'tiles/ice.png',
+    TILE_LAVA: 'tiles/lava.png',
+    TILE_MARSH: 'tiles/marsh.png',
+    TILE_OOZE: 'tiles/ooze.png',
+    TILE_ROCK: 'tiles/rock.png',
+    TILE_BONES: 'tiles/bones.png',
 }
 
+'''
+The sprite for each tile, loaded on first use so importing this module does not load any images.
+The cache is dropped when the asset pipeline re-converts its images for a new display format.
+'''
+@functools.cache
+def tile_sprites() -> dict[Tile, Surface]:
+    return { tile: asset_pipeline.get_image(path) for tile, path in TILE_SPRITE_FILES.items() }
+
+asset_pipeline.display_listeners.append(tile_sprites.cache_clear)
+
 IMPASSABLE_TILES = [
     TILE_ROCK,
     TILE_ICE,
@@ -68,54 +90,203 @@ IMPASSABLE_TILES = [
     TILE_LAVA
 ]
 
+# Lookup table of passability for every tile value
+PASSABLE_LOOKUP = numpy.ones(256, dtype=bool)
+PASSABLE_LOOKUP[IMPASSABLE_TILES] = False
+PASSABLE_LOOKUP[TILE_NONE] = False
+
 '''
 Component that stores a tilemap
 '''
 @enumerate_component("tilemap")
 class TilemapComponent():
     bounds: Rect
-    map: list[list[int]]
+    map: Tilemap
+    dirty: set[tuple[int, int]] = factory(set) # Tiles changed since they were last drawn
+    version: int = 0 # Incremented whenever a tile changes
+    stamps: numpy.ndarray | None = None # The version at which each tile last changed, indexed [y, x]. Created with the map if not given.
+
+    def __post_init__(self):
+        if self.stamps is None:
+            self.stamps = numpy.zeros(numpy.shape(self.map), dtype=numpy.int64)
 
     def get_tile(self, coord: Union[Vector2, tuple[int, int]]):
         if not self.contains(coord):
             return None
         
-        return self.map[int(coord[1])][int(coord[0])]
+        return self.map.item(int(coord[1]), int(coord[0]))
     
     def set_tile(self, coord: Union[Vector2, tuple[int, int]], tile: Tile):
         if not self.contains(coord):
             return
 
-        self.map[int(coord[1])][int(coord[0])] = tile
+        x, y = int(coord[0]), int(coord[1])
+        if self.map.item(y, x) != tile:
+            self.map[y, x] = tile
+            self.dirty.add((x, y))
+            self.version += 1
+            self.stamps[y, x] = self.version
 
     def contains(self, coord: Union[Vector2, tuple[int, int]]):
-        return self.bounds.contains(coord, (0, 0))
+        x, y = int(coord[0]), int(coord[1])
+        bounds = self.bounds
+        return bounds.left <= x < bounds.right and bounds.top <= y < bounds.bottom
     
     def is_passable(self, coord: Union[Vector2, tuple[int, int]]):
-        if self.contains(coord):
-            tile = self.get_tile(coord)
-            return not tile in IMPASSABLE_TILES
-        return False 
+        x, y = int(coord[0]), int(coord[1])
+        bounds = self.bounds
+        if not (bounds.left <= x < bounds.right and bounds.top <= y < bounds.bottom):
+            return False
+        return PASSABLE_LOOKUP[self.map.item(y, x)]
+
+    '''
+    Gathers the tiles at many coordinates at once.
+    Takes an (N, 2) array of x, y coordinates. Coordinates outside the bounds give TILE_NONE.
+    '''
+    def get_tiles(self, coords: numpy.ndarray) -> numpy.ndarray:
+        coords = numpy.asarray(coords, dtype=numpy.intp).reshape(-1, 2)
+        x, y = coords[:, 0], coords[:, 1]
+        bounds = self.bounds
+        inside = (x >= bounds.left) & (x < bounds.right) & (y >= bounds.top) & (y < bounds.bottom)
+        tiles = numpy.full(len(coords), TILE_NONE, dtype=numpy.uint8)
+        tiles[inside] = self.map[y[inside], x[inside]]
+        return tiles
+
+    '''
+    Returns a view of the tiles within the given area (the bounds by default), indexed [y, x].
+    Writing to the view bypasses dirty tracking, so use set_tile for changes that should be drawn.
+    '''
+    def region(self, area: Rect | None = None) -> numpy.ndarray:
+        area = self.bounds.clip(area) if area is not None else self.bounds
+        return self.map[area.top:area.bottom, area.left:area.right]
+
+    '''
+    Returns a boolean mask of the passable tiles within the given area (the bounds by default), indexed [y, x]
+    '''
+    def passable_mask(self, area: Rect | None = None) -> numpy.ndarray:
+        return PASSABLE_LOOKUP[self.region(area)]
 
     @staticmethod
-    def from_map(map: Tilemap):
+    def from_map(map: Tilemap | list[list[int]]):
         bounds = Rect(0, 0, 0, 0)
         bounds.center = (0, 0)
 
+        map = numpy.asarray(map, dtype=numpy.uint8)
         return TilemapComponent(
             map = map,
             bounds = bounds
         )
 
+    '''
+    Returns true if none of the tiles have changed since the given version.
+    Takes the tiles as packed indices, y * width + x, into the whole map.
+    '''
+    def unchanged_since(self, version: int, tiles: list[int]) -> bool:
+        if self.version == version:
+            return True
+        return not tiles or self.stamps.ravel()[tiles].max() <= version
+
+
+'''
+Compiled tilemaps are cached next to their source image, as a header followed by the raw uint8 tiles (row-major).
+The header records the size, modification time and hash of the source, so the cache can be checked without decoding the image.
+It also records a hash of the colour table, so the maps are compiled again when the colours or tiles change.
+'''
+TILEMAP_CACHE_EXTENSION = '.tmap'
+TILEMAP_CACHE_MAGIC = b'TMAP'
+TILEMAP_CACHE_VERSION = 2
+# magic, version, width, height, source size, source mtime (ns), source sha256, colour table sha256
+TILEMAP_CACHE_HEADER = struct.Struct('<4sHIIQq32s32s')
+
+'''
+Hashes the colour table used by parse_tile_surface, including the tile unknown colours become
+'''
+def tile_color_table_hash() -> bytes:
+    digest = hashlib.sha256(TILE_COLOR_KEYS.astype('<u4').tobytes())
+    digest.update(TILE_COLOR_TILES.tobytes())
+    digest.update(bytes([TILE_EARTH]))
+    return digest.digest()
+
+TILE_COLOR_TABLE_HASH = tile_color_table_hash()
+
+def tile_map_cache_path(source_path: str) -> str:
+    return os.path.splitext(source_path)[0] + TILEMAP_CACHE_EXTENSION
 
+'''
+Loads a compiled tilemap, if it exists and matches the source image and colour table. Returns None otherwise.
+The tiles are memory mapped copy-on-write, so the map can be edited without touching the file.
+'''
+def load_compiled_tile_map(source_path: str) -> Tilemap | None:
+    cache_path = tile_map_cache_path(source_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            header = f.read(TILEMAP_CACHE_HEADER.size)
+        magic, version, width, height, size, mtime, digest, table_digest = TILEMAP_CACHE_HEADER.unpack(header)
+        if magic != TILEMAP_CACHE_MAGIC or version != TILEMAP_CACHE_VERSION or table_digest != TILE_COLOR_TABLE_HASH:
+            return None
+        if os.path.getsize(cache_path) != TILEMAP_CACHE_HEADER.size + width * height:
+            return None
+
+        # The hash is only checked when the file looks different, e.g. after being copied
+        stat = os.stat(source_path)
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime) and file_hash(source_path) != digest:
+            return None
+
+        if width * height == 0:
+            return numpy.zeros((height, width), dtype=numpy.uint8)
+        return numpy.memmap(cache_path, dtype=numpy.uint8, mode='c', offset=TILEMAP_CACHE_HEADER.size, shape=(height, width))
+    except (OSError, struct.error, ValueError):
+        return None
+
+'''
+Writes a compiled tilemap for the source image. Failures are ignored, as the cache is only an optimisation.
+'''
+def save_compiled_tile_map(source_path: str, map: Tilemap):
+    cache_path = tile_map_cache_path(source_path)
+    temp_path = cache_path + '.tmp'
+    try:
+        stat = os.stat(source_path)
+        height, width = map.shape
+        header = TILEMAP_CACHE_HEADER.pack(
+            TILEMAP_CACHE_MAGIC, TILEMAP_CACHE_VERSION, width, height,
+            stat.st_size, stat.st_mtime_ns, file_hash(source_path), TILE_COLOR_TABLE_HASH
+        )
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(numpy.ascontiguousarray(map, dtype=numpy.uint8).tobytes())
+        os.replace(temp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+'''
+Loads the tilemap for an image, from its compiled cache when it is up to date.
+Otherwise the image is parsed and the cache is written for next time.
+'''
 def parse_tile_map(image_path: str) -> Tilemap:
-    map_surface = AssetPipeline.get_instance().get_image(image_path)
-    map: Tilemap = list()
-    for y in range(map_surface.get_height()):
-        map.append(list())
-        for x in range(map_surface.get_width()):
-            tile_color = rgb_key(map_surface.get_at((x, y)))
-            tile = TILE_COLOR_MAP.get(tile_color) or TILE_EARTH
-            map[y].append(tile)
-    
+    source_path = AssetPipeline.get_instance().get_path(image_path)
+    map = load_compiled_tile_map(source_path)
+    if map is None:
+        map = parse_tile_image(image_path)
+        save_compiled_tile_map(source_path, map)
     return map
+
+'''
+Converts an image into a tilemap, with each pixel colour looked up in TILE_COLOR_MAP.
+Unknown colours become TILE_EARTH.
+'''
+def parse_tile_image(image_path: str) -> Tilemap:
+    map_surface = AssetPipeline.get_instance().get_image(image_path)
+    return parse_tile_surface(map_surface)
+
+def parse_tile_surface(map_surface: Surface) -> Tilemap:
+    # surfarray arrays are indexed [x, y], so these are transposed into [y, x]
+    rgb = pygame.surfarray.array3d(map_surface).transpose(1, 0, 2).astype(numpy.uint32)
+    alpha = pygame.surfarray.array_alpha(map_surface).transpose(1, 0).astype(numpy.uint32)
+    keys = (rgb[:, :, 0] << 24) | (rgb[:, :, 1] << 16) | (rgb[:, :, 2] << 8) | alpha
+
+    index = numpy.searchsorted(TILE_COLOR_KEYS, keys).clip(0, len(TILE_COLOR_KEYS) - 1)
+    found = TILE_COLOR_KEYS[index] == keys
+    return numpy.where(found, TILE_COLOR_TILES[index], TILE_EARTH).astype(numpy.uint8)
@@ -1,4 +1,4 @@
-from engine.ecs import Entity, EntityGroup, enumerate_component, factory
+from engine.ecs import Entity, EntityGroup, RunCondition, enumerate_component, factory
 from enum import Enum
 
 
@@ -35,6 +35,21 @@ def update_turn_system(group: EntityGroup):
     
 
 
+'''
+Run condition: only while the turn is in the given state
+'''
+def in_state(state: int) -> RunCondition:
+    def condition(group: EntityGroup) -> bool:
+        return group.query_singleton("turn").turn.state == state
+    return condition
+
+'''
+Run condition: only once the player has taken their turn, until the next turn starts
+'''
+def not_waiting(group: EntityGroup) -> bool:
+    return not group.query_singleton("turn").turn.waiting
+
+
 '''
 Mounts the component and systems for handling turn information
 '''
@@ -0,0 +1,6 @@
+import os
+
+# The asset pipeline resolves assets from the working directory, and pygame needs no real display or audio device
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
@@ -0,0 +1,64 @@
+import os
+
+import pygame
+import pytest
+from pygame import Rect
+
+from engine import atlas
+from engine.atlas import Atlas, atlas_cache_path, load_cached_atlas, prune_atlas_cache, save_cached_atlas
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch) -> str:
+    # An absolute cache directory replaces the assets directory when joined onto it
+    monkeypatch.setattr(atlas, 'ATLAS_CACHE_DIR', str(tmp_path))
+    return str(tmp_path)
+
+def make_atlas() -> Atlas:
+    surface = pygame.Surface((4, 2), pygame.SRCALPHA)
+    surface.fill((255, 0, 0, 255), Rect(0, 0, 2, 2))
+    return Atlas(surface, { 'tiles/a.png': Rect(0, 0, 2, 2), 'tiles/b.png': Rect(2, 0, 2, 2) })
+
+def set_age(digest: str, mtime: int):
+    os.utime(atlas_cache_path(digest) + '.json', (mtime, mtime))
+
+def cached_digests(cache_dir: str) -> set[str]:
+    return { name.removesuffix('.json') for name in os.listdir(cache_dir) if name.endswith('.json') }
+
+def test_round_trip():
+    save_cached_atlas('a' * 64, make_atlas())
+    loaded = load_cached_atlas('a' * 64)
+    assert loaded is not None
+    assert loaded.rects == make_atlas().rects
+    assert loaded.surface.get_at((0, 0)) == (255, 0, 0, 255)
+    assert loaded.surface.get_at((3, 1)).a == 0
+
+def test_other_digest_is_a_miss():
+    save_cached_atlas('a' * 64, make_atlas())
+    assert load_cached_atlas('a' * 32 + 'b' * 32) is None
+    assert load_cached_atlas('b' * 64) is None
+
+def test_prune_keeps_most_recently_used(cache_dir):
+    digests = [ f'{i:x}' * 64 for i in range(5) ]
+    for age, digest in enumerate(digests):
+        save_cached_atlas(digest, make_atlas())
+        set_age(digest, 1000 + age)
+
+    prune_atlas_cache(limit=3)
+    assert cached_digests(cache_dir) == { digest[:32] for digest in digests[2:] }
+    assert len(os.listdir(cache_dir)) == 6 # An image for each index
+
+def test_loading_marks_entry_as_used(cache_dir):
+    digests = [ f'{i:x}' * 64 for i in range(3) ]
+    for age, digest in enumerate(digests):
+        save_cached_atlas(digest, make_atlas())
+        set_age(digest, 1000 + age)
+
+    assert load_cached_atlas(digests[0]) is not None
+    prune_atlas_cache(limit=2)
+    assert cached_digests(cache_dir) == { digests[0][:32], digests[2][:32] }
+
+def test_saving_prunes_to_the_limit(cache_dir):
+    for i in range(atlas.ATLAS_CACHE_LIMIT + 3):
+        save_cached_atlas(f'{i:x}' * 64, make_atlas())
+    assert len(cached_digests(cache_dir)) == atlas.ATLAS_CACHE_LIMIT
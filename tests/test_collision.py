@@ -0,0 +1,158 @@
+import random
+
+import numpy
+from pygame import Rect, Vector2
+
+from engine.ecs import Entity, EntityGroup
+from systems import motion, tilemap
+from systems.collision import CollisionComponent, cell_key, mount_collision_system
+from systems.motion import MotionComponent, mount_motion_system
+from systems.tilemap import TilemapComponent
+from systems.turn import TurnComponent
+
+
+def create_group() -> tuple[EntityGroup, CollisionComponent]:
+    group = EntityGroup()
+    mount_collision_system(group)
+    group.run_systems()
+    return group, group.query_singleton('collision').collision
+
+def create_mover(position: tuple[int, int], layer: int | None = motion.LAYER_ENEMIES) -> Entity:
+    e = Entity("mover")
+    e.motion = MotionComponent(position=Vector2(position), layer=layer)
+    return e
+
+def move(collision: CollisionComponent, e: Entity, position: tuple[int, int]):
+    e.motion.position = Vector2(position)
+    collision.queue_move(e)
+
+'''
+The index as it would be rebuilt from scratch, with the entities in each cell in any order
+'''
+def rebuilt_layers(group: EntityGroup) -> list[dict]:
+    layers = [ dict() for _ in range(motion.LAYER_COUNT) ]
+    for e in group.query('motion'):
+        if e.motion.layer is not None:
+            layers[e.motion.layer].setdefault(cell_key(e.motion.position), set()).add(e.id)
+    return layers
+
+def indexed_layers(collision: CollisionComponent) -> list[dict]:
+    return [ { key: { e.id for e in entities } for key, entities in layer.items() } for layer in collision.layers ]
+
+
+def test_added_entities_are_indexed_by_the_collision_update():
+    group, collision = create_group()
+    a, b = create_mover((1, 2)), create_mover((1, 2), motion.LAYER_PLAYER)
+    group.add_all(a, b)
+    assert not collision.is_occupied(Vector2(1, 2), motion.LAYER_ENEMIES)
+
+    group.run_systems()
+    assert list(collision.get_entities_at(Vector2(1, 2), motion.LAYER_ENEMIES)) == [a]
+    assert list(collision.get_entities_at(Vector2(1, 2), motion.LAYER_PLAYER)) == [b]
+    assert collision.is_occupied(Vector2(1.5, 2.5), motion.LAYER_ENEMIES)
+    assert not collision.is_occupied(Vector2(2, 2), motion.LAYER_ENEMIES)
+
+def test_entities_without_a_layer_are_not_indexed():
+    group, collision = create_group()
+    group.add(create_mover((1, 2), motion.LAYER_NONE))
+    group.run_systems()
+    assert collision.entries == {}
+    assert all(not layer for layer in collision.layers)
+
+def test_removed_entities_leave_the_index():
+    group, collision = create_group()
+    a, b = create_mover((1, 2)), create_mover((1, 2))
+    group.add_all(a, b)
+    group.run_systems()
+
+    group.remove(a)
+    group.run_systems()
+    assert list(collision.get_entities_at(Vector2(1, 2), motion.LAYER_ENEMIES)) == [b]
+
+    group.remove(b)
+    group.run_systems()
+    assert (1, 2) not in collision.layers[motion.LAYER_ENEMIES]
+    assert collision.entries == {}
+
+def test_detaching_motion_leaves_the_index():
+    group, collision = create_group()
+    e = create_mover((1, 2))
+    group.add(e)
+    group.run_systems()
+
+    del e.motion
+    group.run_systems()
+    assert not collision.is_occupied(Vector2(1, 2), motion.LAYER_ENEMIES)
+
+def test_queued_moves_count_as_occupied_straight_away():
+    group, collision = create_group()
+    a, b = create_mover((1, 1)), create_mover((1, 1))
+    group.add_all(a, b)
+    group.run_systems()
+
+    move(collision, a, (2, 1))
+    assert collision.is_occupied(Vector2(2, 1), motion.LAYER_ENEMIES)
+    assert collision.is_occupied(Vector2(1, 1), motion.LAYER_ENEMIES) # b is still there
+    move(collision, b, (1, 2))
+    assert not collision.is_occupied(Vector2(1, 1), motion.LAYER_ENEMIES)
+
+    # The entities themselves are moved in the index by the collision update
+    assert list(collision.get_entities_at(Vector2(1, 1), motion.LAYER_ENEMIES)) == [a, b]
+    group.run_systems()
+    assert list(collision.get_entities_at(Vector2(2, 1), motion.LAYER_ENEMIES)) == [a]
+    assert list(collision.get_entities_at(Vector2(1, 2), motion.LAYER_ENEMIES)) == [b]
+    assert collision.moved == {}
+
+def test_movers_cannot_enter_the_same_cell_in_one_frame():
+    group, collision = create_group()
+    e = Entity("tilemap")
+    e.tilemap = TilemapComponent(map=numpy.full((4, 4), tilemap.TILE_EARTH, dtype=numpy.uint8), bounds=Rect(0, 0, 4, 4))
+    t = Entity("turn")
+    t.turn = TurnComponent(waiting=False)
+    a, b, c = create_mover((0, 1)), create_mover((2, 1)), create_mover((3, 1))
+    group.add_all(e, t, a, b, c)
+    mount_motion_system(group)
+    group.run_systems()
+
+    # a and b both head for (1, 1), then c follows into the cell b would leave
+    a.motion.velocity, b.motion.velocity, c.motion.velocity = Vector2(1, 0), Vector2(-1, 0), Vector2(-1, 0)
+    group.run_systems()
+    assert (a.motion.position, b.motion.position, c.motion.position) == (Vector2(1, 1), Vector2(2, 1), Vector2(3, 1))
+
+    b.motion.velocity, c.motion.velocity = Vector2(0, 1), Vector2(-1, 0)
+    group.run_systems()
+    assert (b.motion.position, c.motion.position) == (Vector2(2, 2), Vector2(2, 1))
+
+def test_entities_are_found_within_an_area():
+    group, collision = create_group()
+    inside = [ create_mover((x, 3)) for x in range(2, 5) ]
+    outside = [ create_mover((0, 0)), create_mover((9, 9)) ]
+    group.add_all(*inside, *outside)
+    group.run_systems()
+
+    # Small areas are looked up cell by cell, and large ones by walking the occupied cells
+    for area in (Rect(2, 3, 3, 1), Rect(1, 1, 5, 5)):
+        assert { e.id for e in collision.get_entities_in(area, motion.LAYER_ENEMIES) } == { e.id for e in inside }
+
+def test_the_index_matches_a_rebuild():
+    rng = random.Random(7)
+    group, collision = create_group()
+    entities = []
+    for _ in range(300):
+        action = rng.random()
+        if action < 0.3 or not entities:
+            e = create_mover((rng.randrange(6), rng.randrange(6)), rng.choice([motion.LAYER_PLAYER, motion.LAYER_ENEMIES, motion.LAYER_NONE]))
+            entities.append(e)
+            group.add(e)
+        elif action < 0.45:
+            group.remove(entities.pop(rng.randrange(len(entities))))
+        elif action < 0.9:
+            e = rng.choice(entities)
+            if e._group is group:
+                move(collision, e, (rng.randrange(6), rng.randrange(6)))
+        else:
+            group.run_systems()
+            assert indexed_layers(collision) == rebuilt_layers(group)
+
+    group.run_systems()
+    assert indexed_layers(collision) == rebuilt_layers(group)
@@ -0,0 +1,162 @@
+from engine.ecs import Entity, EntityGroup, enumerate_component
+
+
+@enumerate_component("test_position")
+class PositionComponent():
+    value: int = 0
+
+@enumerate_component("test_tag")
+class TagComponent():
+    pass
+
+
+def create_positioned(name: str, value: int = 0) -> Entity:
+    e = Entity(name)
+    e.test_position = PositionComponent(value=value)
+    return e
+
+
+def test_entities_are_only_added_at_the_flush():
+    group = EntityGroup()
+    e = create_positioned("a")
+    group.add(e)
+    assert list(group.query('test_position')) == []
+
+    group.run_systems()
+    assert list(group.query('test_position')) == [e]
+
+def test_entities_are_grouped_into_archetypes_by_mask():
+    group = EntityGroup()
+    a, b = create_positioned("a"), create_positioned("b")
+    b.test_tag = TagComponent()
+    group.add_all(a, b)
+    group.run_systems()
+
+    assert a._archetype is not b._archetype
+    assert a._archetype.mask == a.mask
+    assert list(group.query('test_position')) == [a, b]
+    assert list(group.query('test_position', 'test_tag')) == [b]
+
+def test_attaching_a_component_moves_the_entity_at_the_flush():
+    group = EntityGroup()
+    e = create_positioned("a")
+    group.add(e)
+    group.run_systems()
+
+    e.test_tag = TagComponent()
+    assert list(group.query('test_tag')) == []
+    group.run_systems()
+    assert list(group.query('test_tag')) == [e]
+    assert e._archetype.mask == e.mask
+
+    del e.test_tag
+    group.run_systems()
+    assert list(group.query('test_tag')) == []
+    assert list(group.query('test_position')) == [e]
+
+def test_cached_queries_see_new_archetypes():
+    group = EntityGroup()
+    a = create_positioned("a")
+    group.add(a)
+    group.run_systems()
+    assert list(group.query('test_position')) == [a]
+
+    b = create_positioned("b")
+    b.test_tag = TagComponent()
+    group.add(b)
+    group.run_systems()
+    assert list(group.query('test_position')) == [a, b]
+
+def test_observers_follow_the_component_set():
+    group = EntityGroup()
+    added, removed = [], []
+    group.observe('test_position', 'test_tag', on_add=added.append, on_remove=removed.append)
+
+    e = create_positioned("a")
+    group.add(e)
+    group.run_systems()
+    assert added == []
+
+    e.test_tag = TagComponent()
+    group.run_systems()
+    assert added == [e]
+
+    group.remove(e)
+    group.run_systems()
+    assert removed == [e]
+
+def test_singletons_are_found_by_component():
+    group = EntityGroup()
+    e = Entity("a")
+    e.test_tag = TagComponent()
+    group.add(e)
+    group.run_systems()
+    assert group.query_singleton('test_tag') is e
+
+def test_removing_swaps_the_last_entity_into_the_gap():
+    group = EntityGroup()
+    entities = [ create_positioned(name, i) for i, name in enumerate("abcd") ]
+    group.add_all(*entities)
+    group.run_systems()
+    a, b, c, d = entities
+
+    group.remove(b)
+    group.run_systems()
+    archetype = a._archetype
+    assert list(archetype) == [a, d, c]
+    assert [ e._row for e in archetype ] == [0, 1, 2]
+    assert b._archetype is None and b._group is None
+
+def test_removing_the_last_entity_leaves_the_others_in_place():
+    group = EntityGroup()
+    a, b = create_positioned("a"), create_positioned("b")
+    group.add_all(a, b)
+    group.run_systems()
+
+    group.remove(b)
+    group.run_systems()
+    assert list(a._archetype) == [a]
+    assert a._row == 0
+
+def test_removing_twice_is_ignored():
+    group = EntityGroup()
+    a, b = create_positioned("a"), create_positioned("b")
+    group.add_all(a, b)
+    group.run_systems()
+
+    group.remove(a)
+    group.remove(a)
+    group.run_systems()
+    assert list(group.query('test_position')) == [b]
+
+def test_ids_are_stable_and_not_reused():
+    group = EntityGroup()
+    a, b, c = create_positioned("a"), create_positioned("b"), create_positioned("c")
+    group.add_all(a, b, c)
+    ids = (a.id, b.id, c.id)
+    assert len(set(ids)) == 3
+    group.run_systems()
+
+    group.remove(a)
+    group.run_systems()
+    assert (b.id, c.id) == ids[1:]
+    assert group.get(a.id) is None
+    assert group.get(c.id) is c
+
+    d = create_positioned("d")
+    group.add(d)
+    group.run_systems()
+    assert d.id not in ids
+    assert group.get(d.id) is d
+
+def test_ids_survive_moving_between_archetypes():
+    group = EntityGroup()
+    e = create_positioned("a")
+    group.add(e)
+    group.run_systems()
+    id = e.id
+
+    e.test_tag = TagComponent()
+    group.run_systems()
+    assert e.id == id
+    assert group.get(id) is e
@@ -0,0 +1,118 @@
+import random
+
+import numpy
+import pytest
+from pygame import Rect, Vector2
+
+from engine.ecs import Entity, EntityGroup
+from systems import tilemap, turn
+from systems.collision import mount_collision_system
+from systems.effect import SHAPE_NONE, create_effect, effect_templates, mount_effect_system
+from systems.effect_grid import GridEffect, EffectGridComponent, EffectRules, mount_effect_grid_system
+from systems.enemy import create_enemy
+from systems.tilemap import TilemapComponent
+
+
+TILES = [
+    tilemap.TILE_EARTH, tilemap.TILE_WATER, tilemap.TILE_MUD, tilemap.TILE_PLANT, tilemap.TILE_EMBER,
+    tilemap.TILE_ICE, tilemap.TILE_ROCK, tilemap.TILE_ASH, tilemap.TILE_MARSH, tilemap.TILE_BONES,
+]
+SIZE = 24
+DIRECTIONS = [ Vector2(1, 0), Vector2(0, 1), Vector2(-1, 0), Vector2(0, -1) ]
+
+def random_map(rng: random.Random) -> numpy.ndarray:
+    return numpy.array([ [ rng.choice(TILES) for _ in range(SIZE) ] for _ in range(SIZE) ], dtype=numpy.uint8)
+
+'''
+A group with only what the effects need, held in the effect turn
+'''
+def create_group(map: numpy.ndarray, effect_grid: bool) -> EntityGroup:
+    group = EntityGroup()
+    t = Entity("turn")
+    t.turn = turn.TurnComponent(state=turn.TURN_EFFECTS)
+    e = Entity("tilemap")
+    e.tilemap = TilemapComponent(map=map.copy(), bounds=Rect(0, 0, SIZE, SIZE))
+    group.add_all(t, e)
+    mount_collision_system(group)
+    if effect_grid:
+        mount_effect_grid_system(group)
+    else:
+        mount_effect_system(group)
+    return group
+
+'''
+Casts an effect of each type onto a tile it can be cast from, and adds a few enemies to take damage
+'''
+def populate(group: EntityGroup, map: numpy.ndarray, rng: random.Random):
+    for name, template in effect_templates().items():
+        cells = [ (x, y) for y in range(SIZE) for x in range(SIZE) if map[y, x] in template.effect.cast_from ]
+        for x, y in rng.sample(cells, min(2, len(cells))):
+            group.add(create_effect(name, Vector2(x, y), rng.choice(DIRECTIONS)))
+    for _ in range(40):
+        group.add(create_enemy((rng.randrange(SIZE), rng.randrange(SIZE))))
+
+def effect_state(group: EntityGroup) -> list[tuple]:
+    grids = list(group.query('effect_grid'))
+    if grids:
+        rules = grids[0].effect_grid.rules
+        return [ (e.cell, rules.names[e.type], e.energy, e.shape) for e in grids[0].effect_grid.effects ]
+    return [ ((int(e.motion.position.x), int(e.motion.position.y)), e.effect.name, e.effect.energy, e.effect.shape) for e in group.query('effect', 'motion') ]
+
+def run_turns(seed: int, effect_grid: bool, turns: int) -> list[tuple]:
+    rng = random.Random(seed)
+    map = random_map(rng)
+    group = create_group(map, effect_grid)
+    populate(group, map, rng)
+
+    random.seed(seed)
+    states = []
+    for _ in range(turns):
+        group.run_systems()
+        group._flush_entity_queues() # So the spread and removed effect entities are in place to compare
+        tm = group.query_singleton('tilemap').tilemap
+        health = [ e.health.health for e in group.query('enemy', 'health') ]
+        states.append((tm.map.tobytes(), health, effect_state(group)))
+    return states
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_the_grid_plays_out_as_the_effect_system(seed):
+    entities = run_turns(seed, False, 12)
+    grid = run_turns(seed, True, 12)
+    assert any(state[2] for state in entities) # Something happened
+    for turn_number, (expected, actual) in enumerate(zip(entities, grid)):
+        assert actual == expected, f"Turn {turn_number}"
+
+def test_cast_effects_are_absorbed_into_the_grid():
+    map = numpy.full((SIZE, SIZE), tilemap.TILE_EARTH, dtype=numpy.uint8)
+    group = create_group(map, True)
+    group.add(create_effect("growth", Vector2(3, 4)))
+    group.run_systems()
+    group._flush_entity_queues()
+    assert list(group.query('effect')) == []
+    grid: EffectGridComponent = group.query_singleton('effect_grid').effect_grid
+    assert grid.effects == []
+
+
+def create_grid() -> EffectGridComponent:
+    return EffectGridComponent(rules=EffectRules(effect_templates()))
+
+def test_removing_swaps_the_last_effect_into_the_gap():
+    grid = create_grid()
+    effects = [ GridEffect(0, (i, 0), 1, (1, 0), SHAPE_NONE) for i in range(4) ]
+    for effect in effects:
+        grid.add(effect)
+
+    grid.remove(effects[1])
+    grid.remove(effects[1]) # Removing twice is ignored
+    assert grid.effects == [ effects[0], effects[3], effects[2] ]
+    assert [ effect.row for effect in grid.effects ] == [0, 1, 2]
+    assert (1, 0) not in grid.cells
+
+def test_effects_in_a_cell_keep_their_order():
+    grid = create_grid()
+    effects = [ GridEffect(t, (2, 2), 1, (1, 0), SHAPE_NONE) for t in range(3) ]
+    for effect in effects:
+        grid.add(effect)
+    grid.remove(effects[0])
+    assert grid.cells[(2, 2)] == effects[1:]
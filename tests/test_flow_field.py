@@ -0,0 +1,91 @@
+import random
+
+import numpy
+from pygame import Rect, Vector2
+
+from systems import tilemap
+from systems.enemy import COST_LOOKUP, FlowFieldComponent, find_path
+from systems.tilemap import TilemapComponent
+
+
+def create_tilemap(map: list[list[int]], bounds: Rect | None = None) -> TilemapComponent:
+    map = numpy.array(map, dtype=numpy.uint8)
+    height, width = map.shape
+    return TilemapComponent(map=map, bounds=bounds or Rect(0, 0, width, height))
+
+def random_tilemap(width: int, height: int, seed: int) -> TilemapComponent:
+    rng = random.Random(seed)
+    tiles = [tilemap.TILE_EARTH, tilemap.TILE_MUD, tilemap.TILE_WATER, tilemap.TILE_ROCK, tilemap.TILE_BONES]
+    return create_tilemap([ [ rng.choice(tiles) for _ in range(width) ] for _ in range(height) ])
+
+def distance_at(field: FlowFieldComponent, x: int, y: int) -> float:
+    area = field.area
+    return field.distances[(y - area.top) * area.width + (x - area.left)]
+
+
+def test_distances_on_open_ground_are_manhattan():
+    tm = create_tilemap([[tilemap.TILE_EARTH] * 6] * 5)
+    field = FlowFieldComponent()
+    field.update(tm, (2, 1), 0)
+    for y in range(5):
+        for x in range(6):
+            assert distance_at(field, x, y) == abs(x - 2) + abs(y - 1)
+
+def test_distances_match_the_cost_of_the_a_star_path():
+    tm = random_tilemap(12, 9, seed=3)
+    goal = (7, 4)
+    field = FlowFieldComponent()
+    field.update(tm, goal, 0)
+
+    costs = COST_LOOKUP[tm.map].ravel().tolist()
+    for y in range(9):
+        for x in range(12):
+            path, reached = find_path(tm, (x, y), goal)
+            if not reached:
+                continue
+            assert distance_at(field, x, y) == sum(costs[node] for node in path[1:])
+
+def test_following_the_field_reaches_the_goal():
+    tm = random_tilemap(10, 10, seed=5)
+    goal = (8, 2)
+    field = FlowFieldComponent()
+    field.update(tm, goal, 0)
+
+    position = Vector2(1, 8)
+    for _ in range(100):
+        if (int(position.x), int(position.y)) == goal:
+            break
+        step = field.next_velocity(position)
+        next = position + step
+        assert distance_at(field, int(next.x), int(next.y)) < distance_at(field, int(position.x), int(position.y))
+        position = next
+    assert (int(position.x), int(position.y)) == goal
+
+def test_the_field_covers_only_the_bounds():
+    tm = create_tilemap([[tilemap.TILE_EARTH] * 8] * 8, bounds=Rect(2, 1, 4, 5))
+    field = FlowFieldComponent()
+    field.update(tm, (3, 3), 0)
+    assert field.area == Rect(2, 1, 4, 5)
+    assert len(field.distances) == 4 * 5
+    assert distance_at(field, 2, 1) == 1 + 2
+
+def test_goals_outside_the_bounds_give_no_velocity():
+    tm = create_tilemap([[tilemap.TILE_EARTH] * 4] * 4, bounds=Rect(0, 0, 3, 3))
+    field = FlowFieldComponent()
+    field.update(tm, (3, 3), 0)
+    assert all(distance == float('inf') for distance in field.distances)
+    assert field.next_velocity(Vector2(1, 1)) == Vector2(0)
+
+def test_the_field_is_computed_once_per_turn_and_goal():
+    tm = create_tilemap([[tilemap.TILE_EARTH] * 4] * 4)
+    field = FlowFieldComponent()
+    field.update(tm, (0, 0), 1)
+    distances = field.distances
+
+    tm.set_tile((1, 0), tilemap.TILE_BONES)
+    field.update(tm, (0, 0), 1)
+    assert field.distances is distances
+
+    field.update(tm, (0, 0), 2)
+    assert field.distances is not distances
+    assert distance_at(field, 2, 0) == 4 # Around the bones, rather than through them
@@ -0,0 +1,117 @@
+import numpy
+import pytest
+from pygame import Rect, Vector2
+
+from systems import enemy, tilemap
+from systems.enemy import EnemyComponent, cached_a_star, find_path
+from systems.tilemap import TilemapComponent
+
+
+def create_tilemap(width: int, height: int, bounds: Rect | None = None) -> TilemapComponent:
+    map = numpy.full((height, width), tilemap.TILE_EARTH, dtype=numpy.uint8)
+    return TilemapComponent(map=map, bounds=bounds or Rect(0, 0, width, height))
+
+def unpack(path: list[int], width: int) -> list[tuple[int, int]]:
+    return [ (node % width, node // width) for node in path ]
+
+@pytest.fixture
+def searches(monkeypatch) -> list[tuple]:
+    calls = []
+    def counted_find_path(tm, start, goal, *args):
+        calls.append((start, goal))
+        return find_path(tm, start, goal, *args)
+    monkeypatch.setattr(enemy, 'find_path', counted_find_path)
+    return calls
+
+
+def test_paths_lead_from_the_start_to_the_goal_in_single_steps():
+    tm = create_tilemap(8, 6)
+    path, reached = find_path(tm, (1, 1), (6, 4))
+    cells = unpack(path, 8)
+    assert reached
+    assert cells[0] == (1, 1) and cells[-1] == (6, 4)
+    assert len(cells) == 1 + 5 + 3
+    for (ax, ay), (bx, by) in zip(cells, cells[1:]):
+        assert abs(ax - bx) + abs(ay - by) == 1
+
+def test_paths_avoid_costly_tiles():
+    tm = create_tilemap(5, 3)
+    for y in range(2):
+        tm.set_tile((2, y), tilemap.TILE_BONES)
+    path, reached = find_path(tm, (0, 0), (4, 0))
+    assert reached
+    assert (2, 2) in unpack(path, 5)
+
+def test_paths_stay_within_the_bounds():
+    tm = create_tilemap(8, 8, bounds=Rect(2, 2, 4, 4))
+    path, reached = find_path(tm, (2, 2), (5, 5))
+    assert reached
+    assert all(2 <= x < 6 and 2 <= y < 6 for x, y in unpack(path, 8))
+
+@pytest.mark.parametrize("goal", [(7, 7), (-1, 0), (3, 2)])
+def test_goals_that_cannot_be_stood_on_are_not_searched(goal):
+    tm = create_tilemap(8, 8, bounds=Rect(0, 0, 6, 6))
+    tm.set_tile((3, 2), tilemap.TILE_ROCK)
+    assert find_path(tm, (0, 0), goal) == ([], False)
+
+def test_searches_that_run_out_of_nodes_head_for_the_closest_node():
+    tm = create_tilemap(20, 1)
+    path, reached = find_path(tm, (0, 0), (19, 0), max_nodes=5)
+    assert not reached
+    assert unpack(path, 20) == [ (x, 0) for x in range(5) ]
+
+
+def test_cached_paths_are_reused_along_the_path(searches):
+    tm = create_tilemap(8, 8)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+    position, goal = Vector2(0, 0), Vector2(5, 3)
+
+    for _ in range(8):
+        position += cached_a_star(tm, e, position, goal)
+    assert position == goal
+    assert len(searches) == 1
+
+def test_cached_paths_are_dropped_when_the_goal_moves(searches):
+    tm = create_tilemap(8, 8)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 4))
+    assert len(searches) == 2
+
+def test_cached_paths_are_dropped_when_the_bounds_change(searches):
+    tm = create_tilemap(8, 8)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    tm.bounds = Rect(0, 0, 7, 7)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    assert len(searches) == 2
+
+def test_cached_paths_are_dropped_when_a_tile_on_them_changes(searches):
+    tm = create_tilemap(8, 8)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+
+    x, y = unpack(e.path, 8)[-2]
+    tm.set_tile((x, y), tilemap.TILE_BONES)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    assert len(searches) == 2
+
+def test_cached_paths_survive_changes_off_the_path(searches):
+    tm = create_tilemap(8, 8)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+
+    off_path = next((x, y) for y in range(8) for x in range(8) if y * 8 + x not in e.path)
+    tm.set_tile(off_path, tilemap.TILE_BONES)
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    assert len(searches) == 1
+
+def test_unreachable_goals_are_not_cached(searches):
+    tm = create_tilemap(8, 8)
+    tm.set_tile((5, 3), tilemap.TILE_ROCK)
+    e = EnemyComponent(damage=1, pathing=enemy.PATHING_A_STAR)
+
+    assert cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3)) == Vector2(0)
+    assert e.path == []
+    cached_a_star(tm, e, Vector2(0, 0), Vector2(5, 3))
+    assert len(searches) == 2
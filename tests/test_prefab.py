@@ -0,0 +1,99 @@
+from pygame import Rect, Surface, Vector2
+
+from engine.ecs import Entity, EntityGroup, Prefab, enumerate_component, factory
+
+
+@enumerate_component("test_prefab")
+class PrefabTestComponent():
+    count: int = 0
+    label: str = ""
+    point: tuple = (0, 0)
+    position: Vector2 = factory(Vector2)
+    area: Rect = factory(lambda: Rect(0, 0, 1, 1))
+    names: list[str] = factory(list)
+    nested: list[list[int]] = factory(list)
+    table: dict[int, tuple[int, int]] = factory(dict)
+    surface: Surface | None = None
+
+
+def create_template() -> Entity:
+    e = Entity("template")
+    e.test_prefab = PrefabTestComponent(
+        count=3,
+        label="fire",
+        point=(1, 2),
+        position=Vector2(4, 5),
+        area=Rect(1, 2, 3, 4),
+        names=["a", "b"],
+        nested=[[1], [2]],
+        table={1: (2, 3)},
+        surface=Surface((2, 2)),
+    )
+    return e
+
+def plan_fields(prefab: Prefab) -> tuple[set[str], dict[str, object]]:
+    (key, component_type, shared, copied), = prefab.plan
+    assert key == 'test_prefab'
+    assert component_type is PrefabTestComponent
+    return set(shared), dict(copied)
+
+
+def test_the_plan_shares_immutable_values_and_copies_the_rest():
+    shared, copied = plan_fields(Prefab(create_template()))
+    assert shared == {'count', 'label', 'point', 'surface'}
+    assert set(copied) == {'position', 'area', 'names', 'nested', 'table'}
+
+def test_instances_match_the_template():
+    template = create_template()
+    e = Prefab(template).create()
+    assert e is not template
+    assert e.name == template.name
+    assert e.mask == template.mask
+    assert e.test_prefab == template.test_prefab
+    assert e.test_prefab is not template.test_prefab
+
+def test_mutable_fields_are_not_shared_between_instances():
+    template = create_template()
+    a, b = Prefab(template).instantiate(2)
+
+    a.test_prefab.position.x = 10
+    a.test_prefab.area.x = 10
+    a.test_prefab.names.append("c")
+    a.test_prefab.nested[0].append(9)
+    a.test_prefab.table[4] = (5, 6)
+
+    for other in (b, template):
+        assert other.test_prefab.position == Vector2(4, 5)
+        assert other.test_prefab.area == Rect(1, 2, 3, 4)
+        assert other.test_prefab.names == ["a", "b"]
+        assert other.test_prefab.nested == [[1], [2]]
+        assert other.test_prefab.table == {1: (2, 3)}
+
+def test_surfaces_are_shared():
+    template = create_template()
+    e = Prefab(template).create()
+    assert e.test_prefab.surface is template.test_prefab.surface
+
+def test_instances_read_the_template_when_created():
+    template = create_template()
+    prefab = Prefab(template)
+    template.test_prefab.count = 7
+    template.test_prefab.names = ["z"]
+    e = prefab.create()
+    assert e.test_prefab.count == 7
+    assert e.test_prefab.names == ["z"]
+
+def test_instances_can_join_a_group():
+    prefab = Prefab(create_template())
+    group = EntityGroup()
+    entities = prefab.instantiate(3)
+    group.add_all(*entities)
+    group.run_systems()
+    assert list(group.query('test_prefab')) == entities
+    assert len({ e.id for e in entities }) == 3
+
+def test_clone_copies_through_a_prefab():
+    template = create_template()
+    e = template.clone()
+    e.test_prefab.names.append("c")
+    assert template.test_prefab.names == ["a", "b"]
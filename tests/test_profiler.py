@@ -0,0 +1,39 @@
+import csv
+import json
+
+from engine.profiler import HISTOGRAM_BUCKETS_MS, Profiler, histogram_columns
+
+
+def create_profiler() -> Profiler:
+    profiler = Profiler(history=4)
+    for ms in (0.01, 0.3, 0.3, 20.0):
+        profiler.record("system", ms / 1000, entities=2)
+    return profiler
+
+def test_histogram_columns_are_named_by_bucket_edge():
+    columns = histogram_columns()
+    assert len(columns) == len(HISTOGRAM_BUCKETS_MS) + 1
+    assert columns[0] == "le_0.05ms"
+    assert columns[-2] == "le_16ms"
+    assert columns[-1] == "gt_16ms"
+
+def test_csv_export_includes_histogram(tmp_path):
+    path = str(tmp_path / "profile.csv")
+    create_profiler().export(path)
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    assert len(rows) == 1
+    row = rows[0]
+    assert row["name"] == "system"
+    assert row["calls"] == "4"
+    counts = { column: int(row[column]) for column in histogram_columns() }
+    assert counts == { column: 0 for column in histogram_columns() } | { "le_0.05ms": 1, "le_0.5ms": 2, "gt_16ms": 1 }
+
+def test_json_export_matches_csv_histogram(tmp_path):
+    profiler = create_profiler()
+    profiler.export(str(tmp_path / "profile.json"))
+    with open(tmp_path / "profile.json") as f:
+        data = json.load(f)
+    assert data["histogram_buckets_ms"] == list(HISTOGRAM_BUCKETS_MS)
+    assert data["systems"][0]["histogram"] == profiler.systems["system"].histogram()
@@ -0,0 +1,99 @@
+import os
+import shutil
+
+import numpy
+import pygame
+import pytest
+from pygame import Color
+
+from systems import tilemap
+from systems.tilemap import load_compiled_tile_map, parse_tile_surface, save_compiled_tile_map, tile_map_cache_path
+
+
+COLORS = {
+    tilemap.TILE_EARTH: '#67584b',
+    tilemap.TILE_WATER: '#4772e5',
+    tilemap.TILE_PLANT: '#6ad127',
+    tilemap.TILE_ROCK: '#9fa2aa',
+}
+
+def write_map_image(path: str, tiles: list[list[int]]):
+    surface = pygame.Surface((len(tiles[0]), len(tiles)), pygame.SRCALPHA)
+    for y, row in enumerate(tiles):
+        for x, tile in enumerate(row):
+            surface.set_at((x, y), Color(COLORS[tile]))
+    pygame.image.save(surface, path)
+
+@pytest.fixture
+def source(tmp_path) -> str:
+    path = str(tmp_path / "map.png")
+    write_map_image(path, [
+        [tilemap.TILE_EARTH, tilemap.TILE_WATER, tilemap.TILE_PLANT],
+        [tilemap.TILE_ROCK, tilemap.TILE_EARTH, tilemap.TILE_WATER],
+    ])
+    return path
+
+def compile_map(source: str) -> numpy.ndarray:
+    map = parse_tile_surface(pygame.image.load(source))
+    save_compiled_tile_map(source, map)
+    return map
+
+
+def test_images_are_parsed_into_tiles(source):
+    map = parse_tile_surface(pygame.image.load(source))
+    assert map.dtype == numpy.uint8
+    assert map.tolist() == [
+        [tilemap.TILE_EARTH, tilemap.TILE_WATER, tilemap.TILE_PLANT],
+        [tilemap.TILE_ROCK, tilemap.TILE_EARTH, tilemap.TILE_WATER],
+    ]
+
+def test_compiled_maps_round_trip(source):
+    map = compile_map(source)
+    assert os.path.exists(tile_map_cache_path(source))
+
+    loaded = load_compiled_tile_map(source)
+    assert loaded is not None
+    assert loaded.shape == map.shape
+    assert (loaded == map).all()
+
+def test_loaded_maps_can_be_edited_without_changing_the_cache(source):
+    map = compile_map(source)
+    loaded = load_compiled_tile_map(source)
+    loaded[0, 0] = tilemap.TILE_LAVA
+    assert (load_compiled_tile_map(source) == map).all()
+
+def test_missing_caches_are_not_loaded(source):
+    assert load_compiled_tile_map(source) is None
+
+def test_changed_sources_invalidate_the_cache(source):
+    compile_map(source)
+    write_map_image(source, [[tilemap.TILE_WATER] * 3] * 2)
+    assert load_compiled_tile_map(source) is None
+
+def test_copied_sources_with_the_same_content_still_match(source, tmp_path):
+    map = compile_map(source)
+    copy = str(tmp_path / "copy.png")
+    shutil.copyfile(source, copy)
+    shutil.copyfile(tile_map_cache_path(source), tile_map_cache_path(copy))
+    os.utime(copy, ns=(0, 0))
+
+    loaded = load_compiled_tile_map(copy)
+    assert loaded is not None
+    assert (loaded == map).all()
+
+def test_a_changed_colour_table_invalidates_the_cache(source, monkeypatch):
+    compile_map(source)
+    monkeypatch.setattr(tilemap, 'TILE_COLOR_TABLE_HASH', bytes(32))
+    assert load_compiled_tile_map(source) is None
+
+def test_a_changed_cache_version_invalidates_the_cache(source, monkeypatch):
+    compile_map(source)
+    monkeypatch.setattr(tilemap, 'TILEMAP_CACHE_VERSION', tilemap.TILEMAP_CACHE_VERSION + 1)
+    assert load_compiled_tile_map(source) is None
+
+def test_truncated_caches_are_not_loaded(source):
+    compile_map(source)
+    cache_path = tile_map_cache_path(source)
+    with open(cache_path, 'r+b') as f:
+        f.truncate(os.path.getsize(cache_path) - 1)
+    assert load_compiled_tile_map(source) is None